@@ -0,0 +1,247 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MISSING = object()
+STAMP_KEY = 'two_tier:stamp:{}'
+
+
+class TwoTierCache(BaseCache):
+    """Небольшой LRU в памяти процесса перед общим кешем.
+
+    Локально хранятся только ключи с префиксами из LOCAL_PREFIXES.
+    Префикс 'immutable' означает, что значение по ключу не меняется
+    (в ключе уже есть версия, как у карточек постов), такие записи
+    живут до LOCAL_TIMEOUT. Для 'mutable' префиксов каждая запись
+    записывает в общий кеш новый штамп префикса; локальная копия
+    верна, пока её штамп совпадает с общим. Штампы перечитываются
+    не чаще раза в STAMP_INTERVAL секунд: другие процессы видят
+    запись с задержкой до STAMP_INTERVAL, процесс, который писал, -
+    сразу. 'checked' - как 'mutable', но штамп читается из общего
+    кеша при каждом чтении, одним запросом на get_many: запись сразу
+    видна всем процессам, а вместо всех ключей читается один штамп.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'MAX_ENTRIES': 1000,
+                'LOCAL_TIMEOUT': 5,
+                'STAMP_INTERVAL': 1,
+                'LOCAL_PREFIXES': {'post_card:': 'immutable'},
+            },
+        },
+        'shared': {...},
+    }
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._max_entries = options.get('MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._stamp_interval = options.get('STAMP_INTERVAL', 1)
+        self._prefixes = options.get('LOCAL_PREFIXES', {})
+        self._local = OrderedDict()
+        self._stamps = {}
+        self._stamps_read = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'local': {'hits': 0, 'misses': 0},
+            'shared': {'hits': 0, 'misses': 0},
+        }
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _prefix(self, key):
+        for prefix in self._prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    def _current_stamps(self, keys):
+        """Штампы префиксов для чтения ключей `keys`."""
+        prefixes = {
+            prefix for prefix in map(self._prefix, keys)
+            if self._prefixes.get(prefix) == 'checked'
+        }
+        now = time.monotonic()
+        if now - self._stamps_read >= self._stamp_interval:
+            prefixes.update(
+                prefix for prefix, mode in self._prefixes.items()
+                if mode == 'mutable'
+            )
+            self._stamps_read = now
+        if prefixes:
+            stamp_keys = {
+                STAMP_KEY.format(prefix): prefix for prefix in prefixes
+            }
+            found = self.shared.get_many(stamp_keys)
+            self._stamps = {**self._stamps, **{
+                prefix: found.get(key, 0)
+                for key, prefix in stamp_keys.items()
+            }}
+        return self._stamps
+
+    def _bump_stamp(self, prefix):
+        if self._prefixes.get(prefix) not in ('mutable', 'checked'):
+            return
+        # новое значение, а не incr: у FileBasedCache incr - это get
+        # и set, и две параллельные записи дали бы один и тот же штамп
+        stamp = time.time_ns()
+        self.shared.set(STAMP_KEY.format(prefix), stamp, None)
+        # локальные копии со старым штампом становятся невалидными
+        self._stamps = {**self._stamps, prefix: stamp}
+
+    def _local_get(self, key, version, stamps):
+        prefix = self._prefix(key)
+        if prefix is None:
+            return MISSING
+        stamp = stamps.get(prefix, 0)
+        with self._lock:
+            entry = self._local.get((key, version))
+            if entry is not None:
+                value, expires, entry_stamp = entry
+                if expires > time.monotonic() and entry_stamp == stamp:
+                    self._local.move_to_end((key, version))
+                    self._stats['local']['hits'] += 1
+                    return value
+                del self._local[(key, version)]
+            self._stats['local']['misses'] += 1
+        return MISSING
+
+    def _local_set(self, key, value, version, timeout=None, stamps=None):
+        prefix = self._prefix(key)
+        if prefix is None:
+            return
+        # штамп, прочитанный до значения: запись между ними только
+        # сделает локальную копию невалидной
+        stamp = (self._stamps if stamps is None else stamps).get(prefix, 0)
+        ttl = self._local_timeout
+        if isinstance(timeout, (int, float)):
+            ttl = min(ttl, timeout)
+        with self._lock:
+            self._local[(key, version)] = (
+                value, time.monotonic() + ttl, stamp
+            )
+            self._local.move_to_end((key, version))
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version):
+        with self._lock:
+            self._local.pop((key, version), None)
+
+    def _count_shared(self, hits, misses):
+        with self._lock:
+            self._stats['shared']['hits'] += hits
+            self._stats['shared']['misses'] += misses
+
+    def get(self, key, default=None, version=None):
+        stamps = self._current_stamps([key])
+        value = self._local_get(key, version, stamps)
+        if value is not MISSING:
+            return value
+        value = self.shared.get(key, MISSING, version=version)
+        if value is MISSING:
+            self._count_shared(0, 1)
+            return default
+        self._count_shared(1, 0)
+        self._local_set(key, value, version, stamps=stamps)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        stamps = self._current_stamps(keys)
+        found = {}
+        remote = []
+        for key in keys:
+            value = self._local_get(key, version, stamps)
+            if value is MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            self._count_shared(len(fetched), len(remote) - len(fetched))
+            for key, value in fetched.items():
+                self._local_set(key, value, version, stamps=stamps)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._bump_stamp(self._prefix(key))
+        self._local_set(key, value, version, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for prefix in {self._prefix(key) for key in data}:
+            self._bump_stamp(prefix)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(key, value, version, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._bump_stamp(self._prefix(key))
+            self._local_set(key, value, version, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self._bump_stamp(self._prefix(key))
+        self._local_delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        for prefix in {self._prefix(key) for key in keys}:
+            self._bump_stamp(prefix)
+        for key in keys:
+            self._local_delete(key, version)
+
+    def has_key(self, key, version=None):
+        stamps = self._current_stamps([key])
+        if self._local_get(key, version, stamps) is not MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._bump_stamp(self._prefix(key))
+        self._local_set(key, value, version)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+            self._stamps = {}
+            self._stamps_read = 0
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        """Попадания, промахи и доля попаданий по уровням кеша."""
+        with self._lock:
+            stats = {
+                tier: dict(counters)
+                for tier, counters in self._stats.items()
+            }
+        for counters in stats.values():
+            total = counters['hits'] + counters['misses']
+            counters['ratio'] = counters['hits'] / total if total else 0.0
+        return stats
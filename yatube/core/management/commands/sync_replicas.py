@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import mark_synced
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплики REPLICA_DATABASES '
+        'через backup API. Реплика получает согласованный снимок, '
+        'запись в основную базу при этом не ждёт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять раз в N секунд, 0 - скопировать один раз',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError(
+                'Реплик нет: задайте YATUBE_REPLICA или REPLICA_DATABASES'
+            )
+        source = connections[DEFAULT_DB_ALIAS]
+        copied = None
+        while True:
+            # data_version меняется, когда другие соединения коммитят
+            # в базу: без записей копировать нечего
+            with source.cursor() as cursor:
+                cursor.execute('PRAGMA data_version')
+                version = cursor.fetchone()[0]
+            if version != copied:
+                for alias in settings.REPLICA_DATABASES:
+                    self.sync(source, alias)
+                copied = version
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, source, alias):
+        started = time.perf_counter()
+        target = connections[alias]
+        target.ensure_connection()
+        source.connection.backup(target.connection)
+        mark_synced(alias)
+        self.stdout.write(
+            f'{alias}: {time.perf_counter() - started:.2f} с'
+        )
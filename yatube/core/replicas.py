@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# до какого времени (unix) клиент читает из основной базы
+PIN_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def replica_alias():
+    """Реплика, из которой сейчас читает поток, или None."""
+    return getattr(_state, 'replica', None)
+
+
+def stamp_key(alias):
+    return f'replica:{alias}'
+
+
+def mark_synced(alias):
+    """Отмечает в кеше, что реплика догнала основную базу."""
+    cache.set(stamp_key(alias), time.time_ns(), None)
+
+
+def pinned(request):
+    try:
+        return float(request.COOKIES[PIN_COOKIE]) > time.time()
+    except (KeyError, ValueError):
+        return False
+
+
+def read_from_replica(view):
+    """Чтение вьюхи идёт из случайной реплики REPLICA_DATABASES.
+
+    Только для GET и HEAD и только если клиент недавно ничего не писал:
+    иначе, пока реплика отстаёт, он не увидел бы свой пост или
+    комментарий. Запись из такой вьюхи всё равно уходит в основную базу.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            not settings.REPLICA_DATABASES
+            or request.method not in SAFE_METHODS
+            or pinned(request)
+        ):
+            return view(request, *args, **kwargs)
+        _state.replica = random.choice(settings.REPLICA_DATABASES)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = None
+    return wrapper
+
+
+class ReplicaRouter:
+    """Запись - в основную базу, чтение моделей posts - в реплику во
+    вьюхах с read_from_replica.
+
+    Сессии и пользователи всегда читаются из основной базы: сессия,
+    записанная при входе, ещё не успела бы попасть в реплику. Реплики
+    копируются из основной базы целиком, вместе со схемой, поэтому
+    миграции к ним не применяются.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'posts':
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        instance = hints.get('instance')
+        db = instance._state.db if instance is not None else None
+        if db and db not in settings.REPLICA_DATABASES:
+            # объекты отдельных баз (migrate --database, bench_sqlite)
+            # пишутся туда же, откуда прочитаны
+            return db
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """После записи в базу клиент REPLICA_PIN_SECONDS читает из основной.
+
+    Отметка хранится в cookie, а не в сессии: её проверка не стоит
+    запроса к базе. Middleware стоит перед SessionMiddleware, чтобы
+    запись сессии тоже учитывалась.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = False
+        response = self.get_response(request)
+        if _state.wrote and settings.REPLICA_DATABASES:
+            response.set_cookie(
+                PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
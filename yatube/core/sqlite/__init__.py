@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def atomic_write(using=None):
+    """transaction.atomic для блока, который сначала читает, потом пишет.
+
+    Внешняя транзакция начинается с BEGIN IMMEDIATE и сразу берёт
+    блокировку записи: транзакция BEGIN DEFERRED, перешедшая от чтения
+    к записи, получает "database is locked", не дожидаясь busy_timeout.
+    Обычный atomic начинается с BEGIN и не мешает читать параллельно.
+    Вложенный atomic_write - просто atomic.
+    """
+    connection = transaction.get_connection(using)
+    connection.begin_immediate = not connection.in_atomic_block
+    try:
+        with transaction.atomic(using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
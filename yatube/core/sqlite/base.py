@@ -0,0 +1,48 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в которой чтение не ждёт запись и наоборот.
+
+    Каждое новое соединение выполняет PRAGMA из OPTIONS['PRAGMAS']
+    (WAL, synchronous, mmap_size, cache_size, busy_timeout), остальные
+    OPTIONS уходят в sqlite3.connect как обычно. Транзакция, которая
+    читает, а потом пишет, открывается core.sqlite.atomic_write.
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.sqlite',
+            'NAME': 'db.sqlite3',
+            'CONN_MAX_AGE': 60,
+            'OPTIONS': {'PRAGMAS': {'journal_mode': 'WAL'}},
+        },
+    }
+    """
+
+    def get_new_connection(self, conn_params):
+        conn_params = dict(conn_params)
+        pragmas = conn_params.pop('PRAGMAS', {})
+        conn = super().get_new_connection(conn_params)
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    # выставляет core.sqlite.atomic_write перед BEGIN
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        # только пишущие блоки берут блокировку записи с самого начала,
+        # транзакции на чтение не ждут писателей
+        if self.begin_immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
+
+    def is_usable(self):
+        # проверка соединения, которое Django держит между запросами
+        # (CONN_MAX_AGE), после ошибки в базе
+        try:
+            self.connection.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
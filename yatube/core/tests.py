@@ -1,8 +1,177 @@
-from django.test import TestCase
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase)
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from posts.models import Post, User
+
+from .cache import TwoTierCache
+from .replicas import (PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter,
+                       read_from_replica)
+from .sqlite import atomic_write
 
 
 class ViewTestClass(TestCase):
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
-        self.assertTemplateUsed(response, 'core/404.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'core/404.html')
+
+
+class TwoTierCacheTest(TestCase):
+    def make_cache(self, **options):
+        options = {
+            'SHARED': 'shared',
+            'STAMP_INTERVAL': 0,
+            'LOCAL_PREFIXES': {'card:': 'immutable', 'gen:': 'mutable'},
+            **options,
+        }
+        return TwoTierCache(None, {'OPTIONS': options})
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_tests_use_memory_cache(self):
+        """Тесты не трогают файловый кеш разработчика."""
+        self.assertIsInstance(caches['shared'], LocMemCache)
+
+    def test_local_tier_serves_hot_keys(self):
+        """Повторное чтение горячего ключа не идёт в общий кеш."""
+        cache = self.make_cache()
+        cache.set('card:1', 'html')
+        caches['shared'].delete('card:1')
+        self.assertEqual(cache.get('card:1'), 'html')
+        self.assertEqual(cache.stats()['local']['hits'], 1)
+
+    def test_other_keys_skip_local_tier(self):
+        """Ключи без локального префикса читаются из общего кеша."""
+        cache = self.make_cache()
+        cache.set('other', 1)
+        caches['shared'].delete('other')
+        self.assertIsNone(cache.get('other'))
+        self.assertEqual(cache.stats()['shared']['misses'], 1)
+
+    def test_mutable_keys_invalidated_across_processes(self):
+        """Запись в одном процессе сбрасывает локальную копию в другом."""
+        first, second = self.make_cache(), self.make_cache()
+        first.set('gen:posts', 1)
+        self.assertEqual(second.get('gen:posts'), 1)
+        first.incr('gen:posts')
+        self.assertEqual(second.get('gen:posts'), 2)
+
+    def test_checked_keys_fresh_within_stamp_interval(self):
+        """Запись 'checked' ключа другой процесс видит сразу."""
+        prefixes = {'gen:': 'checked'}
+        first, second = (
+            self.make_cache(STAMP_INTERVAL=60, LOCAL_PREFIXES=prefixes)
+            for _ in range(2)
+        )
+        first.set('gen:posts', 1)
+        self.assertEqual(second.get_many(['gen:posts']), {'gen:posts': 1})
+        first.set('gen:posts', 2)
+        self.assertEqual(second.get_many(['gen:posts']), {'gen:posts': 2})
+        self.assertEqual(second.get('gen:posts'), 2)
+        self.assertEqual(second.stats()['local']['hits'], 1)
+
+    def test_local_tier_is_bounded(self):
+        """Локальный уровень вытесняет давно не читанные ключи."""
+        cache = self.make_cache(MAX_ENTRIES=2)
+        for i in range(3):
+            cache.set(f'card:{i}', i)
+        caches['shared'].clear()
+        self.assertEqual(cache.get_many(['card:0', 'card:1', 'card:2']), {
+            'card:1': 1,
+            'card:2': 2,
+        })
+
+
+class SQLiteBackendTest(TestCase):
+    def test_pragmas_applied(self):
+        """Новое соединение выполняет PRAGMA из настроек базы."""
+        pragmas = settings.DATABASES['default']['OPTIONS']['PRAGMAS']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            busy_timeout = cursor.fetchone()[0]
+            cursor.execute('PRAGMA cache_size')
+            cache_size = cursor.fetchone()[0]
+        self.assertEqual(busy_timeout, pragmas['busy_timeout'])
+        self.assertEqual(cache_size, pragmas['cache_size'])
+
+    def test_connection_usable(self):
+        connection.ensure_connection()
+        self.assertTrue(connection.is_usable())
+
+
+class SQLiteTransactionTest(TransactionTestCase):
+    def begin_statements(self, atomic):
+        with CaptureQueriesContext(connection) as queries:
+            with atomic():
+                with atomic():
+                    Post.objects.exists()
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('BEGIN')]
+
+    def test_atomic_begins_deferred(self):
+        """Обычный atomic не берёт блокировку записи."""
+        self.assertEqual(self.begin_statements(transaction.atomic),
+                         ['BEGIN'])
+
+    def test_atomic_write_begins_immediate(self):
+        self.assertEqual(self.begin_statements(atomic_write),
+                         ['BEGIN IMMEDIATE'])
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+        @read_from_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Post) or 'default')
+
+        self.view = view
+
+    def test_reads_go_to_replica(self):
+        response = self.view(self.factory.get('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertIsNone(self.router.db_for_read(Post))
+
+    def test_unsafe_methods_read_primary(self):
+        response = self.view(self.factory.post('/'))
+        self.assertEqual(response.content, b'default')
+
+    def test_pinned_client_reads_primary(self):
+        """Недавно писавший клиент видит свои записи."""
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = str(time.time() + 10)
+        self.assertEqual(self.view(request).content, b'default')
+
+    def test_other_apps_read_primary(self):
+        """Сессии и пользователи не читаются из отстающей реплики."""
+        @read_from_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(User) or 'default')
+
+        self.assertEqual(view(self.factory.get('/')).content, b'default')
+
+    def test_write_pins_client(self):
+        def write(request):
+            self.router.db_for_write(Post)
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(write)(self.factory.post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = ReplicaPinMiddleware(self.view)(self.factory.get('/'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_replicas_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertIsNone(self.router.allow_migrate('default', 'posts'))
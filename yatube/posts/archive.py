@@ -0,0 +1,174 @@
+import heapq
+
+from django.conf import settings
+from django.db import connections, router
+
+from core.sqlite import atomic_write
+
+from .counters import ALL_POSTS, author_key, change_counters, group_key
+from .generations import bump, post_scope, timeline_scope
+from .models import (ArchivedComment, ArchivedPost, Comment, Post,
+                     TimelineEntry)
+from .utils import (CountedPaginator, CursorPaginator, cursor_page,
+                    keyset_slice)
+
+
+def delete_rows(model, column, ids):
+    """DELETE строк `model`, у которых `column` из `ids`, без сигналов."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(column)} IN ({placeholders})',
+            ids,
+        )
+
+
+def archive_batch(cutoff, batch_size):
+    """Переносит в архив до `batch_size` самых старых постов до `cutoff`.
+
+    Посты уходят вместе с комментариями, записи лент подписок удаляются.
+    Удаление идёт без сигналов, как bulk_create: счётчики и поколения
+    кеша обновляются здесь одним разом. Возвращает число постов.
+    """
+    with atomic_write():
+        posts = list(
+            Post.objects.filter(pub_date__lt=cutoff).order_by(
+                'pub_date', 'id'
+            ).values(*(
+                field.attname for field in Post._meta.concrete_fields
+            ))[:batch_size]
+        )
+        if not posts:
+            return 0
+        ids = [post['id'] for post in posts]
+        ArchivedPost.objects.bulk_create(
+            ArchivedPost(**post) for post in posts
+        )
+        ArchivedComment.objects.bulk_create(
+            ArchivedComment(**comment)
+            for comment in Comment.objects.filter(post_id__in=ids).values(
+                *(field.attname for field in Comment._meta.concrete_fields)
+            )
+        )
+        readers = set(TimelineEntry.objects.filter(
+            post_id__in=ids
+        ).values_list('user_id', flat=True))
+        # DELETE без сигналов: пост не удаляется, а переезжает, и его
+        # данные в производных структурах остаются верными:
+        # - счётчики ленты и групп уменьшаются ниже одним разом, а
+        #   счётчики автора и картинки учитывают архив и не меняются;
+        #   count_deleted_post уменьшил бы их;
+        # - поколения кеша тех же областей, что у count_deleted_post и
+        #   invalidate_comments, меняет bump ниже;
+        # - картинкой теперь владеет архивный пост: release_deleted_image
+        #   уменьшил бы её счётчик ссылок и удалил бы файл;
+        # - записи лент удаляются здесь же, сигналов у них нет;
+        # - поисковый индекс обновляют триггеры FTS в самой базе.
+        for model, column in (
+            (TimelineEntry, 'post_id'),
+            (Comment, 'post_id'),
+            (Post, 'id'),
+        ):
+            delete_rows(model, column, ids)
+        deltas = {ALL_POSTS: -len(posts)}
+        for post in posts:
+            if post['group_id'] is not None:
+                key = group_key(post['group_id'])
+                deltas[key] = deltas.get(key, 0) - 1
+        change_counters(deltas)
+        bump(
+            list(deltas)
+            + [author_key(post['author_id']) for post in posts]
+            + [post_scope(post_id) for post_id in ids]
+            + [timeline_scope(user_id) for user_id in readers]
+        )
+    return len(posts)
+
+
+def find_post(post_id):
+    """Пост или архивный пост с этим id, иначе None."""
+    for model in (Post, ArchivedPost):
+        post = model.objects.select_related('author', 'group').filter(
+            id=post_id
+        ).first()
+        if post is not None:
+            return post
+    return None
+
+
+class ArchivePaginator(CursorPaginator):
+    """Посты, а за ними архивные, по ключу (pub_date, id).
+
+    Страница сливается из двух запросов, как лента подписок: в архиве
+    могут оказаться и посты новее самых старых в Post, например
+    импортированные после переноса.
+    """
+
+    def __init__(self, posts, archived, per_page, **kwargs):
+        super().__init__(posts, per_page, **kwargs)
+        self.archived = archived
+
+    def fetch(self, key, forward, limit):
+        merged = heapq.merge(
+            keyset_slice(self.object_list, key, forward, limit),
+            keyset_slice(self.archived, key, forward, limit),
+            key=lambda post: (post.pub_date, post.id),
+            reverse=forward,
+        )
+        return list(merged)[:limit]
+
+
+class ArchiveChain:
+    """Посты, а за ними архивные, как одна последовательность.
+
+    Нужна для нумерованных страниц `?page=N`: Paginator берёт из неё
+    срезы. Архивные посты считаются старше всех в Post. `count` - общее
+    число постов из счётчика (счётчик автора учитывает и архив): тогда
+    число обычных постов - разность с архивом, без COUNT(*) по Post.
+    """
+
+    def __init__(self, posts, archived, count=None):
+        self.posts = posts.order_by('-pub_date', '-id')
+        self.archived = archived.order_by('-pub_date', '-id')
+        self.total = count
+        self.hot = None
+
+    def count(self):
+        if self.total is None:
+            self.total = self.hot_count() + self.archived.count()
+        return self.total
+
+    def hot_count(self):
+        if self.hot is None:
+            if self.total is None:
+                self.hot = self.posts.count()
+            else:
+                self.hot = max(self.total - self.archived.count(), 0)
+        return self.hot
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        hot = self.hot_count()
+        found = list(self.posts[start:stop]) if start < hot else []
+        if stop > hot:
+            found += self.archived[max(start - hot, 0):stop - hot]
+        return found
+
+
+def archive_page(posts, archived, request, count=None):
+    """Как paginator_function, но с архивными постами после обычных."""
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        paginator = CountedPaginator(
+            ArchiveChain(posts, archived, count=count),
+            settings.MAX_PAGE_AMOUNT,
+            count=count,
+        )
+        return paginator.get_page(page_number)
+    paginator = ArchivePaginator(
+        posts, archived, settings.MAX_PAGE_AMOUNT, count=count
+    )
+    return cursor_page(paginator, request)
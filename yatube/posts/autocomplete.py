@@ -0,0 +1,249 @@
+import bisect
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from .counters import AUTHOR_PREFIX, GROUP_PREFIX, counts_by_id
+from .models import Group, User
+
+# больше всего совпадений у коротких префиксов, их ответы запоминаются
+MEMO_PREFIX_LENGTH = 2
+# снимок индекса в общем кеше: версия, записи этой версии и изменения
+# групп и пользователей после её сборки
+VERSION_KEY = 'autocomplete:version'
+CHANGES_KEY = 'autocomplete:changes'
+
+
+def snapshot_key(version):
+    return f'autocomplete:index:{version}'
+
+
+class PrefixIndex:
+    """Отсортированный список ключей для поиска групп и авторов по префиксу.
+
+    Ключ - username, slug или название группы в нижнем регистре.
+    Префикс находится двумя bisect, из найденного диапазона берутся
+    записи с наибольшим числом постов.
+    """
+
+    def __init__(self):
+        self.fill({}, None)
+        self.lock = threading.Lock()
+
+    def fill(self, entries, version):
+        """Заменяет содержимое: {(тип, id): (ключи, запись)}."""
+        keys = sorted(
+            (key, kind, pk)
+            for (kind, pk), (entry_keys, _) in entries.items()
+            for key in entry_keys
+        )
+        self.keys = keys
+        self.entries = dict(entries)
+        self.memo = {}
+        self.version = version
+        # отметка применённых изменений из CHANGES_KEY
+        self.changes = None
+
+    def apply(self, changes, stamp):
+        """Применяет изменения {(тип, id): (ключи, запись) или None}."""
+        with self.lock:
+            for (kind, pk), value in changes.items():
+                if value is None:
+                    self._remove(kind, pk)
+                elif self.entries.get((kind, pk)) != value:
+                    self._put(kind, pk, *value)
+            self.changes = stamp
+
+    def _put(self, kind, pk, keys, entry):
+        self._remove(kind, pk)
+        for key in keys:
+            bisect.insort(self.keys, (key, kind, pk))
+        self.entries[kind, pk] = (keys, entry)
+        self._forget(keys)
+
+    def _remove(self, kind, pk):
+        old = self.entries.pop((kind, pk), None)
+        if old is None:
+            return
+        for key in old[0]:
+            position = bisect.bisect_left(self.keys, (key, kind, pk))
+            del self.keys[position]
+        self._forget(old[0])
+
+    def _forget(self, keys):
+        # ответы остальных коротких префиксов не изменились
+        for key in keys:
+            for length in range(1, MEMO_PREFIX_LENGTH + 1):
+                self.memo.pop(key[:length], None)
+
+    def search(self, prefix, limit):
+        with self.lock:
+            if len(prefix) > MEMO_PREFIX_LENGTH:
+                return self._search(prefix, limit)
+            found = self.memo.get(prefix)
+            if found is None:
+                found = self.memo[prefix] = self._search(
+                    prefix, settings.AUTOCOMPLETE_LIMIT
+                )
+            return found[:limit]
+
+    def _search(self, prefix, limit):
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix + '\U0010ffff',))
+        # у группы совпасть могут и slug, и название
+        matched = {(kind, pk) for _, kind, pk in self.keys[start:end]}
+        entries = [self.entries[match][1] for match in matched]
+        return heapq.nsmallest(
+            limit,
+            entries,
+            key=lambda entry: (-entry['posts'], entry['label'].lower()),
+        )
+
+
+index = PrefixIndex()
+
+
+def user_entry(user, posts):
+    return [user.username.lower()], {
+        'type': 'user',
+        'label': user.username,
+        'value': user.username,
+        'url': reverse('posts:profile', args=[user.username]),
+        'posts': posts,
+    }
+
+
+def group_entry(group, posts):
+    keys = sorted({group.slug.lower(), group.title.lower()})
+    return keys, {
+        'type': 'group',
+        'label': group.title,
+        'value': group.slug,
+        'url': reverse('posts:group_list', args=[group.slug]),
+        'posts': posts,
+    }
+
+
+def collect():
+    """Записи всех групп и авторов: четыре запроса."""
+    authors = counts_by_id(AUTHOR_PREFIX)
+    groups = counts_by_id(GROUP_PREFIX)
+    entries = {}
+    for user in User.objects.only('id', 'username').iterator():
+        entries['user', user.id] = user_entry(user, authors.get(user.id, 0))
+    for group in Group.objects.only('id', 'slug', 'title').iterator():
+        entries['group', group.id] = group_entry(
+            group, groups.get(group.id, 0)
+        )
+    return entries
+
+
+def build():
+    """Собирает индекс и публикует его снимок в общем кеше.
+
+    Это проход по всем группам и пользователям, поэтому он делается
+    командой build_autocomplete, а не в запросе. Процессы сайта
+    подхватывают новый снимок при следующей подсказке. Возвращает
+    число записей.
+    """
+    entries = collect()
+    version = time.time_ns()
+    previous = cache.get(VERSION_KEY)
+    cache.set(snapshot_key(version), entries, None)
+    # изменения, записанные во время сборки, уже в снимке
+    cache.set_many({
+        VERSION_KEY: version,
+        CHANGES_KEY: {'version': version, 'stamp': None, 'entries': {}},
+    }, None)
+    if previous is not None:
+        cache.delete(snapshot_key(previous))
+    with index.lock:
+        index.fill(entries, version)
+    return len(entries)
+
+
+def sync():
+    """Подтягивает в индекс процесса снимок и изменения из общего кеша.
+
+    Обычно это одно чтение двух ключей; снимок целиком читается,
+    только когда build_autocomplete опубликовал новую версию.
+    """
+    found = cache.get_many([VERSION_KEY, CHANGES_KEY])
+    version = found.get(VERSION_KEY)
+    if version is None:
+        return
+    if version != index.version:
+        entries = cache.get(snapshot_key(version))
+        if entries is None:
+            return
+        with index.lock:
+            index.fill(entries, version)
+    changes = found.get(CHANGES_KEY)
+    if (
+        changes is not None
+        and changes['version'] == version
+        and changes['stamp'] != index.changes
+    ):
+        index.apply(changes['entries'], changes['stamp'])
+
+
+def suggest(query, limit):
+    """До `limit` групп и авторов, чьё имя начинается с `query`.
+
+    Индекс живёт в памяти процесса и сверяется со снимком в общем
+    кеше. Новые и изменённые группы и пользователи попадают в него
+    сразу (сигналы post_save), а число постов обновляет пересборка
+    командой build_autocomplete.
+    """
+    prefix = query.strip().lower()
+    if not prefix:
+        return []
+    sync()
+    return index.search(prefix, limit)
+
+
+def record_change(kind, pk, value):
+    """Записывает изменение для индексов всех процессов и применяет его.
+
+    Изменения дописываются в CHANGES_KEY без блокировки: запись,
+    потерянная в гонке двух процессов, вернётся со следующей сборкой.
+    """
+    changes = cache.get(CHANGES_KEY)
+    if changes is None or changes['version'] != index.version:
+        return
+    changes['entries'][kind, pk] = value
+    changes['stamp'] = time.time_ns()
+    cache.set(CHANGES_KEY, changes, None)
+    index.apply(changes['entries'], changes['stamp'])
+
+
+def entry_kind(instance):
+    return 'group' if isinstance(instance, Group) else 'user'
+
+
+def update_entry(instance):
+    """Обновляет в собранном индексе группу или пользователя."""
+    sync()
+    if index.version is None:
+        return
+    kind = entry_kind(instance)
+    old = index.entries.get((kind, instance.pk))
+    posts = old[1]['posts'] if old is not None else 0
+    if kind == 'user':
+        value = user_entry(instance, posts)
+    else:
+        value = group_entry(instance, posts)
+    # пользователь сохраняется и при каждом входе
+    if old != value:
+        record_change(kind, instance.pk, value)
+
+
+def remove_entry(instance):
+    sync()
+    kind = entry_kind(instance)
+    if (kind, instance.pk) in index.entries:
+        record_change(kind, instance.pk, None)
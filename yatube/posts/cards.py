@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .generations import GROUPS_SCOPE, get_generations
+from .thumbnails import attach_image_sources
+from .utils import EPOCH, ONE_MICROSECOND
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, groups_generation):
+    """Ключ карточки меняется при любом сохранении поста."""
+    updated = (post.updated - EPOCH) // ONE_MICROSECOND
+    return f'post_card:{post.id}:{updated}:{groups_generation}'
+
+
+def render_cards(posts):
+    """Список HTML карточек постов: один get_many на страницу.
+
+    Карточка одинакова на главной, в группе, профиле и ленте подписок,
+    поэтому рендерится один раз и берётся из кеша во всех лентах.
+    """
+    posts = list(posts)
+    groups_generation = get_generations([GROUPS_SCOPE])[GROUPS_SCOPE]
+    keys = [card_key(post, groups_generation) for post in posts]
+    cards = cache.get_many(keys)
+    to_render = {
+        key: post for key, post in zip(keys, posts) if key not in cards
+    }
+    # URL миниатюр всех рендерящихся карточек одним запросом к кешу
+    attach_image_sources(to_render.values(), 'card')
+    missing = {
+        key: render_to_string(CARD_TEMPLATE, {'post': post})
+        for key, post in to_render.items()
+    }
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,111 @@
+import hashlib
+from collections import Counter
+
+from django.db.models import Count, F
+
+from .models import ArchivedPost, Follow, Post, PostCounter
+
+ALL_POSTS = 'posts'
+AUTHOR_PREFIX = 'author:'
+GROUP_PREFIX = 'group:'
+FOLLOWERS_PREFIX = 'followers:'
+IMAGE_PREFIX = 'image:'
+
+
+def author_key(author_id):
+    return f'{AUTHOR_PREFIX}{author_id}'
+
+
+def group_key(group_id):
+    return f'{GROUP_PREFIX}{group_id}'
+
+
+def followers_key(author_id):
+    return f'{FOLLOWERS_PREFIX}{author_id}'
+
+
+def image_key(name):
+    """Число постов с файлом картинки `name`."""
+    # имя файла может не поместиться в ключ счётчика
+    return IMAGE_PREFIX + hashlib.md5(name.encode()).hexdigest()
+
+
+def authors_with_followers_over(limit):
+    """id авторов, у которых подписчиков больше `limit`."""
+    # диапазон по уникальному индексу key вместо LIKE 'followers:%'
+    keys = PostCounter.objects.filter(
+        key__gte=FOLLOWERS_PREFIX,
+        key__lt=FOLLOWERS_PREFIX[:-1] + ';',
+        value__gt=limit,
+    ).values_list('key', flat=True)
+    return [int(key[len(FOLLOWERS_PREFIX):]) for key in keys]
+
+
+def counts_by_id(prefix):
+    """{id: значение} всех счётчиков с префиксом вроде AUTHOR_PREFIX."""
+    counters = PostCounter.objects.filter(
+        key__gte=prefix, key__lt=prefix[:-1] + ';'
+    ).values_list('key', 'value')
+    return {int(key[len(prefix):]): value for key, value in counters}
+
+
+def post_keys(author_id, group_id):
+    """Счётчики, в которые входит пост с такими автором и группой."""
+    keys = [ALL_POSTS, author_key(author_id)]
+    if group_id is not None:
+        keys.append(group_key(group_id))
+    return keys
+
+
+def change_counters(deltas):
+    """Применяет словарь {ключ: приращение} атомарными UPDATE."""
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        updated = PostCounter.objects.filter(key=key).update(
+            value=F('value') + delta
+        )
+        if not updated:
+            PostCounter.objects.create(key=key, value=delta)
+
+
+def get_count(key):
+    return get_counts([key])[key]
+
+
+def get_counts(keys):
+    """Значения счётчиков одним запросом, отсутствующий ключ - ноль."""
+    values = dict(
+        PostCounter.objects.filter(key__in=keys).values_list('key', 'value')
+    )
+    return {key: values.get(key, 0) for key in keys}
+
+
+def actual_counts():
+    """Пересчитывает все счётчики по таблицам постов и подписок.
+
+    Общий счётчик и счётчики групп - только посты лент, счётчики
+    автора и картинки учитывают и архив.
+    """
+    counts = Counter({ALL_POSTS: Post.objects.count()})
+    posts = Post.objects.order_by()
+    by_group = posts.filter(group__isnull=False).values_list(
+        'group'
+    ).annotate(Count('id'))
+    for group_id, count in by_group:
+        counts[group_key(group_id)] = count
+    for queryset in (posts, ArchivedPost.objects.order_by()):
+        by_author = queryset.values_list('author').annotate(Count('id'))
+        for author_id, count in by_author:
+            counts[author_key(author_id)] += count
+        by_image = queryset.exclude(image='').values_list(
+            'image'
+        ).annotate(Count('id'))
+        for name, count in by_image:
+            counts[image_key(name)] += count
+    by_followed = Follow.objects.order_by().values_list(
+        'author'
+    ).annotate(Count('id'))
+    for author_id, count in by_followed:
+        counts[followers_key(author_id)] = count
+    return counts
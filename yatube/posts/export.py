@@ -0,0 +1,130 @@
+import csv
+import heapq
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+
+from .models import ArchivedComment, Comment
+
+# формат: (Content-Type, расширение файла)
+FORMATS = {
+    # строки JSON в формате команды import_content
+    'json': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+}
+CSV_HEADER = ('type', 'id', 'post_id', 'author', 'group', 'date', 'text')
+
+
+def export_rows(posts, chunk_size):
+    return posts.order_by('pub_date', 'id').values_list(
+        'id', 'author__username', 'group__slug', 'text', 'pub_date'
+    ).iterator(chunk_size=chunk_size)
+
+
+def export_batches(posts, chunk_size, archived=None):
+    """Посты по возрастанию даты пачками по `chunk_size` с комментариями.
+
+    Посты читаются одним курсором (iterator), комментарии - одним
+    запросом на пачку, поэтому в памяти не больше одной пачки.
+    Архивные посты `archived` читаются вторым курсором и сливаются
+    с обычными по дате, их комментарии берутся из архива.
+    """
+    rows = export_rows(posts, chunk_size)
+    comment_models = [Comment]
+    if archived is not None:
+        rows = heapq.merge(
+            rows,
+            export_rows(archived, chunk_size),
+            key=lambda row: (row[4], row[0]),
+        )
+        comment_models.append(ArchivedComment)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return
+        comments = defaultdict(list)
+        for model in comment_models:
+            for post_id, *comment in model.objects.filter(
+                post_id__in=[row[0] for row in batch]
+            ).order_by('post_id', 'created', 'id').values_list(
+                'post_id', 'id', 'author__username', 'text', 'created'
+            ):
+                comments[post_id].append(comment)
+        yield batch, comments
+
+
+def json_chunks(batches):
+    for batch, comments in batches:
+        yield ''.join(
+            json.dumps({
+                'type': 'post',
+                'id': post_id,
+                'author': author,
+                'group': group,
+                'text': text,
+                'pub_date': pub_date.isoformat(),
+                'comments': [
+                    {
+                        'author': comment_author,
+                        'text': comment_text,
+                        'created': created.isoformat(),
+                    }
+                    for _, comment_author, comment_text, created
+                    in comments[post_id]
+                ],
+            }, ensure_ascii=False) + '\n'
+            for post_id, author, group, text, pub_date in batch
+        )
+
+
+def csv_chunks(batches):
+    """Строка на пост и на каждый его комментарий."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for batch, comments in batches:
+        for post_id, author, group, text, pub_date in batch:
+            writer.writerow((
+                'post', post_id, '', author, group or '',
+                pub_date.isoformat(), text,
+            ))
+            for comment_id, comment_author, comment_text, created in (
+                comments[post_id]
+            ):
+                writer.writerow((
+                    'comment', comment_id, post_id, comment_author, '',
+                    created.isoformat(), comment_text,
+                ))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_chunks(posts, file_format, chunk_size=None, archived=None):
+    """Текст выгрузки постов кусками, по куску на пачку постов."""
+    batches = export_batches(
+        posts, chunk_size or settings.EXPORT_CHUNK_SIZE, archived
+    )
+    if file_format == 'csv':
+        return csv_chunks(batches)
+    return json_chunks(batches)
+
+
+def export_response(request, posts, name, archived=None):
+    """Потоковый ответ с выгрузкой; формат из параметра `format`."""
+    file_format = request.GET.get('format', 'json')
+    if file_format not in FORMATS:
+        raise Http404(f'Неизвестный формат {file_format}')
+    content_type, extension = FORMATS[file_format]
+    response = StreamingHttpResponse(
+        export_chunks(posts, file_format, archived=archived),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}.{extension}"'
+    )
+    return response
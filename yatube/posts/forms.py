@@ -1,11 +1,23 @@
-from django.forms import ModelForm
+from django.core.exceptions import ValidationError
+from django.forms import ImageField, ModelForm
 
 from .models import Comment, Post
 
 
+class UploadImageField(ImageField):
+    """Картинка с отказом, который записал posts.uploads.ImageUploadHandler."""
+
+    def to_python(self, data):
+        error = getattr(data, 'upload_error', None)
+        if error is not None:
+            raise ValidationError(error, code='upload_limit')
+        return super().to_python(data)
+
+
 class PostForm(ModelForm):
     class Meta:
         model = Post
+        field_classes = {'image': UploadImageField}
         labels = {'group': 'Группа', 'text': 'Сообщение', 'image': 'Изображение'}
         help_texts = {'group': 'Выберите группу', 'text': 'Введите ссообщение'}
         fields = ["group", "text", "image"]
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core.replicas import replica_alias, stamp_key
+
+# название группы выводится в карточках всех лент
+GROUPS_SCOPE = 'groups'
+
+# попадания и промахи кеша фрагментов в этом процессе: общий кеш
+# на диске, и запись в него на каждый фрагмент тормозила бы чтение
+_fragment_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def timeline_scope(user_id):
+    return f'timeline:{user_id}'
+
+
+def generation_key(scope):
+    return f'generation:{scope}'
+
+
+def get_generations(scopes):
+    """Текущие поколения областей ленты одним get_many.
+
+    При чтении из реплики к поколению добавляется отметка её последней
+    синхронизации: фрагмент, собранный по отставшей реплике под новым
+    поколением, перестаёт читаться, когда реплика догонит основную базу.
+    """
+    keys = {generation_key(scope): scope for scope in scopes}
+    replica = replica_alias()
+    stamp = stamp_key(replica) if replica else None
+    found = cache.get_many([*keys, stamp] if stamp else keys)
+    for key in keys.keys() - found.keys():
+        # после вытеснения начинаем не с 1, а с заведомо нового значения,
+        # чтобы не попасть на старые фрагменты
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    if stamp:
+        return {
+            scope: f'{found[key]}.{found.get(stamp)}'
+            for key, scope in keys.items()
+        }
+    return {scope: found[key] for key, scope in keys.items()}
+
+
+def scope_version(*scopes):
+    """Строка поколений для ключа кеша фрагмента."""
+    generations = get_generations(scopes)
+    return '.'.join(f'{generations[scope]}' for scope in scopes)
+
+
+def _bump(scopes):
+    # новое значение, а не incr: у файлового кеша incr не атомарен
+    # между процессами, и после двух параллельных incr поколение
+    # совпало бы с тем, под которым уже лежит фрагмент
+    cache.set_many(
+        {generation_key(scope): time.time_ns() for scope in scopes}, None
+    )
+
+
+def bump(scopes):
+    """Делает закешированные фрагменты областей устаревшими.
+
+    Внутри транзакции поколение меняется сразу и ещё раз после
+    коммита: иначе параллельный запрос может успеть закешировать
+    старые данные под новым поколением. Поколения в TwoTierCache
+    'checked': другие процессы видят новое со следующего чтения.
+    """
+    scopes = list(scopes)
+    if transaction.get_connection().in_atomic_block:
+        _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def count_fragment(hit):
+    with _stats_lock:
+        _fragment_stats['hits' if hit else 'misses'] += 1
+
+
+def fragment_stats():
+    """Попадания и промахи кеша фрагментов лент в этом процессе."""
+    with _stats_lock:
+        return {
+            'hits': _fragment_stats['hits'],
+            'misses': _fragment_stats['misses'],
+        }
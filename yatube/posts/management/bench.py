@@ -0,0 +1,34 @@
+import os
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+
+
+def add_database_argument(parser):
+    parser.add_argument(
+        '--database',
+        required=True,
+        help='Файл SQLite для замера, не рабочая база; создаётся, если нет',
+    )
+
+
+@contextmanager
+def bench_database(path):
+    """Основная база на время замера - отдельный файл `path`.
+
+    Замер пишет до миллиона строк в одной транзакции: в рабочей базе
+    она держала бы блокировку записи и раздувала WAL.
+    """
+    live = connection.settings_dict['NAME']
+    if os.path.abspath(path) == os.path.abspath(live):
+        raise CommandError('Для замера нужна отдельная база, не рабочая')
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    try:
+        call_command('migrate', verbosity=0)
+        yield
+    finally:
+        connection.close()
+        connection.settings_dict['NAME'] = live
@@ -0,0 +1,21 @@
+import json
+import os
+
+
+def load_checkpoint(path):
+    """Сохранённое место команды или {}, если файла нет или он битый."""
+    try:
+        with open(path) as checkpoint:
+            saved = json.load(checkpoint)
+    except (OSError, ValueError):
+        return {}
+    return saved if isinstance(saved, dict) else {}
+
+
+def save_checkpoint(path, **saved):
+    # запись целиком во временный файл: прерванный запуск не оставит
+    # обрезанный json
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump(saved, checkpoint)
+    os.replace(temporary, path)
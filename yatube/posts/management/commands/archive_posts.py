@@ -0,0 +1,68 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.archive import archive_batch
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты старше POST_ARCHIVE_DAYS с комментариями '
+        'в архивные таблицы пачками, по транзакции на пачку. Ленты '
+        'и их индексы остаются маленькими, профиль и страница поста '
+        'показывают архив.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.POST_ARCHIVE_DAYS,
+            help='Переносить посты старше стольких дней',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Постов в транзакции',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Пауза между пачками, сек, чтобы не держать запись сайта',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать посты для переноса',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        if options['dry_run']:
+            count = Post.objects.filter(pub_date__lt=cutoff).count()
+            self.stdout.write(f'Постов старше {cutoff:%Y-%m-%d}: {count}')
+            return
+        total = 0
+        started = time.perf_counter()
+        while True:
+            batch_started = time.perf_counter()
+            moved = archive_batch(cutoff, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            elapsed = time.perf_counter() - batch_started
+            self.stdout.write(
+                f'{total:>10} {moved / elapsed:>8.0f} постов/с'
+            )
+            if options['pause']:
+                time.sleep(options['pause'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'В архиве {total} постов за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import ArchivedPost, Post
+from posts.rendering import fill_rendered_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Сохраняет готовый HTML текста и начало текста постам, у которых '
+        'их нет, включая архивные. Посты обходятся пачками по id; '
+        'прерванный запуск можно просто повторить.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Постов в пачке',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перерендерить все посты, например после смены разметки',
+        )
+
+    def handle(self, *args, **options):
+        for model in (Post, ArchivedPost):
+            posts = model.objects.order_by('pk').only('pk', 'text')
+            if not options['all']:
+                posts = posts.filter(text_html='')
+            total = 0
+            last_id = 0
+            started = time.perf_counter()
+            while True:
+                chunk = list(
+                    posts.filter(pk__gt=last_id)[:options['chunk_size']]
+                )
+                if not chunk:
+                    break
+                for post in chunk:
+                    fill_rendered_text(post)
+                # bulk_update не трогает updated: ключи карточек
+                # в кеше остаются прежними, их HTML не меняется
+                model.objects.bulk_update(
+                    chunk, ['text_html', 'text_excerpt']
+                )
+                last_id = chunk[-1].pk
+                total += len(chunk)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {total}, '
+                f'{total / elapsed:.0f} постов/с'
+            )
@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.management.checkpoint import load_checkpoint, save_checkpoint
+from posts.models import ArchivedPost, Post
+from posts.thumbnails import (
+    backfill_image, refresh_posts, thumbnails_version
+)
+
+# таблицы постов с картинками и ключ их места в файле сохранения
+CHECKPOINT_KEYS = ((Post, 'last_id'), (ArchivedPost, 'last_archived_id'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Делает недостающие миниатюры картинок всех постов, включая '
+        'архивные, пулом процессов. Посты обходятся пачками по id, '
+        'пройденное место сохраняется в файл, и повторный запуск '
+        'продолжает с него.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Постов в пачке',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Процессов пула, 0 - делать миниатюры в этом процессе',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(
+                settings.BASE_DIR, 'thumbnails_backfill.json'
+            ),
+            help='Файл с id последнего обработанного поста',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать с первого поста, не глядя на сохранённое место',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Пауза между пачками, сек, чтобы не отнимать CPU у сайта',
+        )
+
+    def handle(self, *args, **options):
+        version = thumbnails_version()
+        self.checkpoint = options['checkpoint']
+        self.saved = {'version': version}
+        if not options['restart']:
+            saved = load_checkpoint(self.checkpoint)
+            # место, сохранённое при других настройках миниатюр, не
+            # годится: новые варианты нужны и уже пройденным постам
+            if saved.get('version') == version:
+                self.saved.update(saved)
+        pool = None
+        if options['workers']:
+            # новые процессы, а не fork: соединения с базой и кешем
+            # родителя в них не попадают
+            pool = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        self.total_posts = self.total_images = 0
+        started = time.perf_counter()
+        self.stdout.write(
+            f'{"last id":>10} {"posts":>6} {"images":>7} {"new":>5} '
+            f'{"images/s":>9}'
+        )
+        try:
+            # архивные посты тоже показывают картинки
+            for model, key in CHECKPOINT_KEYS:
+                self.backfill(model, key, pool, options)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {self.total_posts}, картинок: {self.total_images}, '
+            f'{self.total_images / elapsed:.1f} картинок/с'
+        ))
+
+    def backfill(self, model, key, pool, options):
+        """Миниатюры постов `model` пачками по id после сохранённого."""
+        last_id = self.saved.get(key, 0)
+        if last_id:
+            self.stdout.write(f'Продолжаем после поста {last_id}')
+        posts = model.objects.exclude(image='').order_by('pk').only(
+            'pk', 'author_id', 'group_id', 'image'
+        )
+        while True:
+            chunk = list(posts.filter(pk__gt=last_id)[:options['chunk_size']])
+            if not chunk:
+                return
+            chunk_started = time.perf_counter()
+            # одинаковые картинки хранятся одним файлом
+            names = sorted({post.image.name for post in chunk})
+            if pool is None:
+                done = map(backfill_image, names)
+            else:
+                done = pool.map(backfill_image, names)
+            changed = set(done) - {None}
+            # без этого в закешированных карточках остались бы
+            # заглушки вместо миниатюр
+            refresh_posts(
+                post for post in chunk if post.image.name in changed
+            )
+            last_id = self.saved[key] = chunk[-1].pk
+            save_checkpoint(self.checkpoint, **self.saved)
+            elapsed = time.perf_counter() - chunk_started
+            self.total_posts += len(chunk)
+            self.total_images += len(names)
+            self.stdout.write(
+                f'{last_id:>10} {len(chunk):>6} {len(names):>7} '
+                f'{len(changed):>5} {len(names) / elapsed:>9.1f}'
+            )
+            if options['pause']:
+                time.sleep(options['pause'])
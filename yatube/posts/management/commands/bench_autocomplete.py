@@ -0,0 +1,68 @@
+import random
+import string
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.autocomplete import build, suggest
+from posts.models import Group, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет время подсказок автодополнения по префиксам длиной '
+        '1-4 на индексе из N пользователей и групп. Данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=100000, help='Число пользователей'
+        )
+        parser.add_argument(
+            '--groups', type=int, default=10000, help='Число групп'
+        )
+        parser.add_argument(
+            '--queries', type=int, default=10000, help='Запросов на длину'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username=self.name(rng, i))
+                for i in range(options['users'])
+            )
+            Group.objects.bulk_create(
+                Group(title=self.name(rng, i), slug=f'group-{i}')
+                for i in range(options['groups'])
+            )
+            started = time.perf_counter()
+            build()
+            self.stdout.write(
+                f'Индекс собран за {time.perf_counter() - started:.2f} с'
+            )
+            self.stdout.write(
+                f'{"prefix":>6} {"p50, us":>8} {"p99, us":>8} {"max, us":>8}'
+            )
+            for length in range(1, 5):
+                timings = []
+                for _ in range(options['queries']):
+                    prefix = ''.join(
+                        rng.choices(string.ascii_lowercase, k=length)
+                    )
+                    started = time.perf_counter()
+                    suggest(prefix, settings.AUTOCOMPLETE_LIMIT)
+                    timings.append((time.perf_counter() - started) * 1e6)
+                timings.sort()
+                self.stdout.write(
+                    f'{length:>6} {timings[len(timings) // 2]:>8.1f} '
+                    f'{timings[len(timings) * 99 // 100]:>8.1f} '
+                    f'{timings[-1]:>8.1f}'
+                )
+            transaction.set_rollback(True)
+
+    def name(self, rng, number):
+        letters = ''.join(rng.choices(string.ascii_lowercase, k=6))
+        return f'{letters}{number}'
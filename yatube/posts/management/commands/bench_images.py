@@ -0,0 +1,118 @@
+import io
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image, ImageFilter
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.thumbnails import (
+    generate_thumbnails, thumbnail_file, thumbnail_options, variants
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает объём картинок страницы ленты: одна JPEG 960px '
+        'против вариантов srcset по ширине экрана. Файлы и записи '
+        'sorl удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=settings.MAX_PAGE_AMOUNT,
+            help='Постов с картинками на странице',
+        )
+        parser.add_argument(
+            '--source',
+            default='2000x1500',
+            help='Размер загруженной картинки',
+        )
+        parser.add_argument(
+            '--viewports',
+            type=int,
+            nargs='+',
+            default=[360, 768, 1280],
+            help='Ширины экрана в CSS-пикселях',
+        )
+        parser.add_argument(
+            '--dpr', type=float, default=1.0, help='Плотность пикселей'
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                with transaction.atomic():
+                    pages = self.measure(options)
+                    transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        baseline = pages.pop('baseline')
+        self.stdout.write(
+            f'{"viewport":>8} {"before, KB":>11} {"after, KB":>10} '
+            f'{"saved":>6}'
+        )
+        for viewport, size in pages.items():
+            saved = 1 - size / baseline
+            self.stdout.write(
+                f'{viewport:>8} {baseline / 1024:>11.1f} '
+                f'{size / 1024:>10.1f} {saved:>6.0%}'
+            )
+
+    def measure(self, options):
+        width, height = (int(side) for side in options['source'].split('x'))
+        card = list(variants('card'))
+        image_format = next(iter(settings.POST_THUMBNAIL_FORMATS))
+        pages = {'baseline': 0}
+        pages.update((viewport, 0) for viewport in options['viewports'])
+        for _ in range(options['posts']):
+            name = default.storage.save(
+                f'posts/bench-{uuid.uuid4().hex}.jpg',
+                ContentFile(self.photo(width, height)),
+            )
+            generate_thumbnails(name)
+            source = ImageFile(name)
+            sizes = {}
+            for variant_format, size, geometry, variant_options in card:
+                thumbnail = thumbnail_file(
+                    source,
+                    geometry,
+                    thumbnail_options(source, variant_options),
+                )
+                sizes[variant_format, size] = default.storage.size(
+                    thumbnail.name
+                )
+            # раньше отдавалась одна JPEG наибольшей ширины
+            pages['baseline'] += sizes['JPEG', card[-1][1]]
+            widths = sorted(
+                size for variant_format, size in sizes
+                if variant_format == image_format
+            )
+            for viewport in options['viewports']:
+                # браузер берёт наименьший вариант не уже экрана
+                needed = viewport * options['dpr']
+                size = next((w for w in widths if w >= needed), widths[-1])
+                pages[viewport] += sizes[image_format, size]
+        return pages
+
+    def photo(self, width, height):
+        """Картинка с шумом: сжимается примерно как фотография."""
+        image = Image.merge('RGB', [
+            Image.linear_gradient('L').resize((width, height)),
+            Image.effect_noise((width, height), 64).filter(
+                ImageFilter.GaussianBlur(2)
+            ),
+            Image.linear_gradient('L').rotate(90).resize((width, height)),
+        ])
+        content = io.BytesIO()
+        image.save(content, 'JPEG', quality=90)
+        return content.getvalue()
@@ -0,0 +1,124 @@
+import random
+import time
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.management.bench import add_database_argument, bench_database
+from posts.models import Post
+from posts.search import SearchPaginator, match_expression, matching_ids
+
+User = get_user_model()
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pu')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает первую страницу поиска по индексу FTS5 и через '
+        'icontains на отдельной базе --database. Данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        add_database_argument(parser)
+        parser.add_argument(
+            '--posts', type=int, default=1000000, help='Число постов'
+        )
+        parser.add_argument(
+            '--words', type=int, default=20, help='Слов в посте'
+        )
+        parser.add_argument(
+            '--vocabulary', type=int, default=5000, help='Размер словаря'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5, help='Повторов каждого запроса'
+        )
+
+    def handle(self, *args, **options):
+        with bench_database(options['database']):
+            self.run(options)
+
+    def run(self, options):
+        vocabulary = self.vocabulary(options['vocabulary'])
+        # частый, средний и редкий по Ципфу, два слова и префикс
+        queries = [
+            vocabulary[0],
+            vocabulary[len(vocabulary) // 10],
+            vocabulary[-1],
+            f'{vocabulary[1]} {vocabulary[2]}',
+            vocabulary[3][:3],
+        ]
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.fill(vocabulary, options)
+            self.stdout.write(
+                f'{options["posts"]} постов за '
+                f'{time.perf_counter() - started:.0f} с'
+            )
+            self.stdout.write(
+                f'{"query":>14} {"matches":>8} {"icontains, ms":>14} '
+                f'{"fts, ms":>8}'
+            )
+            for query in queries:
+                matches = Post.objects.filter(
+                    pk__in=matching_ids(match_expression(query))
+                ).count()
+                like = self.measure(
+                    lambda: self.icontains_page(query), options['repeat']
+                )
+                fts = self.measure(
+                    lambda: self.fts_page(query), options['repeat']
+                )
+                self.stdout.write(
+                    f'{query:>14} {matches:>8} {like:>14.2f} {fts:>8.2f}'
+                )
+            transaction.set_rollback(True)
+
+    def vocabulary(self, size):
+        rng = random.Random(0)
+        words = set()
+        while len(words) < size:
+            words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+        return sorted(words, key=lambda word: (len(word), word))
+
+    def fill(self, vocabulary, options):
+        author = User.objects.create(username='bench-author')
+        rng = random.Random(1)
+        # частоты слов по закону Ципфа
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)
+        ))
+        batch = 10000
+        for start in range(0, options['posts'], batch):
+            Post.objects.bulk_create(
+                Post(
+                    author=author,
+                    text=' '.join(rng.choices(
+                        vocabulary, cum_weights=weights, k=options['words']
+                    )),
+                )
+                for _ in range(min(batch, options['posts'] - start))
+            )
+
+    def measure(self, page, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            page()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def icontains_page(self, query):
+        posts = Post.objects.select_related('author', 'group')
+        for word in query.split():
+            posts = posts.filter(text__icontains=word)
+        return list(posts[:settings.MAX_PAGE_AMOUNT])
+
+    def fts_page(self, query):
+        paginator = SearchPaginator(
+            query,
+            Post.objects.select_related('author', 'group'),
+            settings.MAX_PAGE_AMOUNT,
+        )
+        return list(paginator.page_after())
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from posts.models import Comment, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает чтение ленты и запись комментариев из нескольких '
+        'потоков на SQLite по умолчанию и с настройками из DATABASES. '
+        'Базы создаются во временном каталоге.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--readers', type=int, default=4, help='Потоков чтения'
+        )
+        parser.add_argument(
+            '--writers', type=int, default=2, help='Потоков записи'
+        )
+        parser.add_argument(
+            '--seconds', type=float, default=5, help='Длительность прогона'
+        )
+        parser.add_argument(
+            '--posts', type=int, default=1000, help='Постов в базе'
+        )
+
+    def handle(self, *args, **options):
+        tuned = settings.DATABASES['default']
+        profiles = (
+            ('default', {'ENGINE': 'django.db.backends.sqlite3'}),
+            ('tuned', {
+                'ENGINE': tuned['ENGINE'],
+                'OPTIONS': tuned.get('OPTIONS', {}),
+            }),
+        )
+        self.stdout.write(
+            f'{"profile":>8} {"reads/s":>8} {"writes/s":>9} {"locked":>7}'
+        )
+        directory = tempfile.mkdtemp()
+        try:
+            for name, profile in profiles:
+                alias = f'bench_{name}'
+                connections.databases[alias] = {
+                    **profile,
+                    'NAME': os.path.join(directory, f'{name}.sqlite3'),
+                }
+                try:
+                    reads, writes, locked = self.run(alias, options)
+                finally:
+                    connections[alias].close()
+                    del connections.databases[alias]
+                self.stdout.write(
+                    f'{name:>8} {reads:>8.0f} {writes:>9.0f} {locked:>7}'
+                )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, alias, options):
+        call_command('migrate', database=alias, verbosity=0)
+        author, post = self.populate(alias, options['posts'])
+        load = Load(alias, author, post)
+        threads = [
+            threading.Thread(target=load.worker, args=[load.read])
+            for _ in range(options['readers'])
+        ] + [
+            threading.Thread(target=load.worker, args=[load.write])
+            for _ in range(options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        load.stop.set()
+        for thread in threads:
+            thread.join()
+        return (
+            load.stats['reads'] / options['seconds'],
+            load.stats['writes'] / options['seconds'],
+            load.stats['locked'],
+        )
+
+    def populate(self, alias, posts):
+        author = User(username='bench-author')
+        author.save(using=alias)
+        # raw: сигналы постов пишут счётчики в основную базу; raw не
+        # заполняет auto_now, поэтому даты задаются явно
+        for i in range(posts):
+            now = timezone.now()
+            Post(
+                author=author, text=f'Пост {i}', pub_date=now, updated=now
+            ).save_base(using=alias, raw=True)
+        return author, Post.objects.using(alias).first()
+
+
+class Load:
+    """Потоки чтения и записи одной базы и их общие счётчики."""
+
+    def __init__(self, alias, author, post):
+        self.alias = alias
+        self.author = author
+        self.post = post
+        self.stop = threading.Event()
+        self.stats = {'reads': 0, 'writes': 0, 'locked': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def worker(self, target):
+        try:
+            while not self.stop.is_set():
+                try:
+                    target()
+                except OperationalError:
+                    self.count('locked')
+        finally:
+            connections[self.alias].close()
+
+    def read(self):
+        list(Post.objects.using(self.alias).select_related(
+            'author', 'group'
+        )[:settings.MAX_PAGE_AMOUNT])
+        self.count('reads')
+
+    def write(self):
+        with transaction.atomic(using=self.alias):
+            Comment.objects.using(self.alias).create(
+                post=self.post, author=self.author, text='Комментарий'
+            )
+        self.count('writes')
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from posts.counters import change_counters, followers_key
+from posts.management.bench import add_database_argument, bench_database
+from posts.models import Follow, Post
+from posts.timeline import TimelinePaginator
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку публикации и чтения ленты подписок '
+        'для чистого fan-out и гибридного режима на отдельной базе '
+        '--database. Данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        add_database_argument(parser)
+        parser.add_argument(
+            '--followers',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000, 10000],
+            help='Число подписчиков автора для каждого прогона',
+        )
+        parser.add_argument(
+            '--posts', type=int, default=20, help='Публикаций на прогон'
+        )
+        parser.add_argument(
+            '--reads', type=int, default=50, help='Чтений ленты на прогон'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=settings.TIMELINE_FANOUT_LIMIT,
+            help='Порог подписчиков для гибридного режима',
+        )
+
+    def handle(self, *args, **options):
+        with bench_database(options['database']):
+            self.compare(options)
+
+    def compare(self, options):
+        self.stdout.write(
+            f'{"followers":>10} {"mode":>7} {"write, ms":>10} {"read, ms":>9}'
+        )
+        modes = (
+            ('push', max(options['followers']) + 1),
+            ('hybrid', options['limit']),
+        )
+        for followers in options['followers']:
+            for mode, limit in modes:
+                with override_settings(TIMELINE_FANOUT_LIMIT=limit):
+                    write, read = self.run(followers, options)
+                self.stdout.write(
+                    f'{followers:>10} {mode:>7} {write:>10.2f} {read:>9.2f}'
+                )
+
+    def run(self, followers, options):
+        with transaction.atomic():
+            author = User.objects.create(username='bench-author')
+            User.objects.bulk_create(
+                User(username=f'bench-reader-{i}') for i in range(followers)
+            )
+            readers = User.objects.filter(username__startswith='bench-reader')
+            Follow.objects.bulk_create(
+                Follow(user=reader, author=author) for reader in readers
+            )
+            # bulk_create не вызывает сигналы Follow
+            change_counters({followers_key(author.id): followers})
+
+            started = time.perf_counter()
+            for i in range(options['posts']):
+                Post.objects.create(author=author, text=f'Пост {i}')
+            write = (time.perf_counter() - started) / options['posts']
+
+            reader = readers.first()
+            started = time.perf_counter()
+            for _ in range(options['reads']):
+                paginator = TimelinePaginator(
+                    reader, settings.MAX_PAGE_AMOUNT
+                )
+                list(paginator.page_after())
+            read = (time.perf_counter() - started) / options['reads']
+            transaction.set_rollback(True)
+        return write * 1000, read * 1000
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.autocomplete import build
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает индекс автодополнения групп и авторов и кладёт его '
+        'снимок в общий кеш, откуда его берут процессы сайта. Пока '
+        'снимка нет, подсказки пустые.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.AUTOCOMPLETE_REFRESH,
+            help='Пересобирать раз в N секунд, 0 - собрать один раз',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            entries = build()
+            self.stdout.write(
+                f'Записей: {entries}, {time.perf_counter() - started:.2f} с'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
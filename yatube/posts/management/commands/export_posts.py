@@ -0,0 +1,64 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS, export_chunks
+from posts.models import ArchivedPost, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты автора или группы, включая архивные, '
+        'с комментариями в JSONL (формат import_content) или CSV. '
+        'Посты читаются пачками, память не зависит от их числа.'
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--author', help='username автора')
+        source.add_argument('--group', help='slug группы')
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default='json'
+        )
+        parser.add_argument(
+            '--output', help='Файл выгрузки, без него - в stdout'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать файл выгрузки'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, help='Постов в пачке'
+        )
+
+    def handle(self, *args, **options):
+        if options['author']:
+            filters = {'author__username': options['author']}
+            exists = User.objects.filter(username=options['author'])
+        else:
+            filters = {'group__slug': options['group']}
+            exists = Group.objects.filter(slug=options['group'])
+        if not exists.exists():
+            raise CommandError('Нет такого автора или группы')
+        if options['gzip'] and not options['output']:
+            raise CommandError('Для --gzip нужен --output')
+        chunks = export_chunks(
+            Post.objects.filter(**filters),
+            options['format'],
+            options['chunk_size'],
+            archived=ArchivedPost.objects.filter(**filters),
+        )
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        started = time.perf_counter()
+        opener = gzip.open if options['gzip'] else open
+        with opener(
+            options['output'], 'wt', encoding='utf-8', newline=''
+        ) as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(
+            f'{options["output"]}: {time.perf_counter() - started:.1f} с'
+        )
@@ -0,0 +1,329 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.sqlite import atomic_write
+
+from posts import timeline
+from posts.management.checkpoint import load_checkpoint, save_checkpoint
+from posts.counters import ALL_POSTS, author_key, group_key
+from posts.generations import bump, timeline_scope
+from posts.models import Comment, Follow, Group, Post, User
+from posts.rendering import fill_rendered_text
+from posts.search import create_index, drop_triggers
+
+# строки файла:
+# {"type": "post", "author": "leo", "text": "...", "group": "cats",
+#  "pub_date": "2021-05-01T12:00:00+03:00",
+#  "comments": [{"author": "ann", "text": "...", "created": "..."}]}
+# {"type": "follow", "user": "ann", "author": "leo"}
+# group, pub_date, comments и created необязательны; неизвестные авторы
+# создаются без пароля, неизвестная группа - ошибка строки
+IN_CLAUSE_SIZE = 500
+
+
+def string(data, key, required=True):
+    """Строковое поле строки файла; null или число - ошибка строки.
+
+    Без проверки такое значение дошло бы до INSERT, и IntegrityError
+    откатил бы всю пачку вместо одной строки.
+    """
+    value = data[key] if required else data.get(key)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'{key} должно быть строкой, а не {value!r}')
+    return value
+
+
+def insert(model, objs, fields):
+    """INSERT пачками как у loaddata (raw).
+
+    bulk_create заменил бы даты auto_now_add текущим временем, а при
+    переносе нужны исходные даты постов и комментариев.
+    """
+    batch_size = connection.ops.bulk_batch_size(fields, objs)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager._insert(
+            objs[start:start + batch_size], fields=fields, raw=True
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты с комментариями и подписки из файла JSONL '
+        'пачками INSERT, по транзакции на пачку строк. Счётчики, ленты '
+        'подписок, поисковый индекс и кеш лент обновляются один раз '
+        'в конце. Пройденная строка сохраняется в файл, и повторный '
+        'запуск продолжает с неё.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Строк файла в транзакции',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'import_content.json'),
+            help='Файл с номером последней импортированной строки',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать с первой строки, не глядя на сохранённое место',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только проверить файл, ничего не записывая',
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'Нет файла {path}')
+        self.dry_run = options['dry_run']
+        start_line = 0
+        if not (options['restart'] or self.dry_run):
+            saved = load_checkpoint(options['checkpoint'])
+            if saved.get('file') == path:
+                start_line = saved.get('line', 0)
+        if start_line:
+            self.stdout.write(f'Продолжаем после строки {start_line}')
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.password = make_password(None)
+        self.new_users = set()
+        self.authors = set()
+        self.touched_groups = set()
+        self.followers = set()
+        self.totals = {'post': 0, 'comment': 0, 'follow': 0, 'skipped': 0}
+        started = time.perf_counter()
+        self.stdout.write(
+            f'{"line":>10} {"posts":>6} {"comments":>9} {"follows":>8} '
+            f'{"rows/s":>8}'
+        )
+        if not self.dry_run:
+            # индекс по строке на INSERT дороже, чем одна пересборка
+            with connection.cursor() as cursor:
+                drop_triggers(cursor)
+        try:
+            with open(path, encoding='utf-8') as source:
+                lines = islice(enumerate(source, 1), start_line, None)
+                for chunk in iter(
+                    lambda: list(islice(lines, options['chunk_size'])), []
+                ):
+                    self.import_chunk(chunk, options['checkpoint'], path)
+        finally:
+            if not self.dry_run:
+                self.rebuild()
+        elapsed = time.perf_counter() - started
+        rows = sum(
+            self.totals[kind] for kind in ('post', 'comment', 'follow')
+        )
+        verb = 'Проверено' if self.dry_run else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: постов {self.totals["post"]}, комментариев '
+            f'{self.totals["comment"]}, подписок {self.totals["follow"]}, '
+            f'новых авторов {len(self.new_users)}, пропущено строк '
+            f'{self.totals["skipped"]}, {rows / elapsed:.0f} строк/с'
+        ))
+
+    def import_chunk(self, chunk, checkpoint, path):
+        chunk_started = time.perf_counter()
+        records = [
+            record for record in (
+                self.parse(number, line) for number, line in chunk
+            ) if record is not None
+        ]
+        usernames = {name for record in records for name in record['users']}
+        self.new_users |= usernames - self.users.keys()
+        if self.dry_run:
+            counts = self.count(records)
+        else:
+            with atomic_write():
+                counts = self.write(records, usernames)
+            save_checkpoint(checkpoint, file=path, line=chunk[-1][0])
+        for kind, count in counts.items():
+            self.totals[kind] += count
+        elapsed = time.perf_counter() - chunk_started
+        self.stdout.write(
+            f'{chunk[-1][0]:>10} {counts["post"]:>6} '
+            f'{counts["comment"]:>9} {counts["follow"]:>8} '
+            f'{sum(counts.values()) / elapsed:>8.0f}'
+        )
+
+    def parse(self, number, line):
+        """Проверенная строка файла или None, если её надо пропустить."""
+        if not line.strip():
+            return None
+        try:
+            data = json.loads(line)
+            if data['type'] == 'follow':
+                record = {
+                    'type': 'follow',
+                    'user': string(data, 'user'),
+                    'author': string(data, 'author'),
+                }
+                record['users'] = [record['user'], record['author']]
+                if record['user'] == record['author']:
+                    raise ValueError('подписка на себя')
+                return record
+            if data['type'] != 'post':
+                raise ValueError(f'неизвестный тип {data["type"]!r}')
+            group_id = None
+            group = string(data, 'group', required=False)
+            if group is not None:
+                group_id = self.groups.get(group)
+                if group_id is None:
+                    raise ValueError(f'нет группы {group!r}')
+            comments = [
+                {
+                    'author': string(comment, 'author'),
+                    'text': string(comment, 'text'),
+                    'created': self.parse_date(comment.get('created')),
+                }
+                for comment in data.get('comments', [])
+            ]
+            author = string(data, 'author')
+            return {
+                'type': 'post',
+                'author': author,
+                'text': string(data, 'text'),
+                'group': group_id,
+                'pub_date': self.parse_date(data.get('pub_date')),
+                'comments': comments,
+                'users': [author] + [
+                    comment['author'] for comment in comments
+                ],
+            }
+        except (KeyError, TypeError, ValueError) as error:
+            self.totals['skipped'] += 1
+            self.stderr.write(f'Строка {number} пропущена: {error!r}')
+            return None
+
+    def parse_date(self, value):
+        if value is None:
+            return timezone.now()
+        date = parse_datetime(value)
+        if date is None:
+            raise ValueError(f'неверная дата {value!r}')
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def count(self, records):
+        counts = {'post': 0, 'comment': 0, 'follow': 0}
+        for record in records:
+            counts[record['type']] += 1
+            counts['comment'] += len(record.get('comments', ()))
+        return counts
+
+    def write(self, records, usernames):
+        new = sorted(usernames - self.users.keys())
+        if new:
+            User.objects.bulk_create(
+                User(username=name, password=self.password) for name in new
+            )
+            self.users.update(
+                User.objects.filter(username__in=new).values_list(
+                    'username', 'id'
+                )
+            )
+        # bulk INSERT в SQLite не возвращает id, поэтому id постов
+        # для комментариев выдаём сами. Транзакция начата BEGIN
+        # IMMEDIATE (atomic_write) и держит блокировку записи, так что
+        # до коммита эти id никто не займёт. С sqlite_sequence, а не
+        # с MAX(id): id удалённых постов не используются повторно
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT seq FROM sqlite_sequence WHERE name = %s',
+                [Post._meta.db_table],
+            )
+            row = cursor.fetchone()
+        next_id = (row[0] if row else 0) + 1
+        now = timezone.now()
+        posts, comments, follows = [], [], []
+        for record in records:
+            if record['type'] == 'follow':
+                follows.append(Follow(
+                    user_id=self.users[record['user']],
+                    author_id=self.users[record['author']],
+                ))
+                continue
+            post = Post(
+                id=next_id,
+                author_id=self.users[record['author']],
+                group_id=record['group'],
+                text=record['text'],
+                pub_date=record['pub_date'],
+                updated=now,
+            )
+            fill_rendered_text(post)
+            next_id += 1
+            posts.append(post)
+            comments.extend(
+                Comment(
+                    post_id=post.id,
+                    author_id=self.users[comment['author']],
+                    text=comment['text'],
+                    created=comment['created'],
+                )
+                for comment in record['comments']
+            )
+        insert(Post, posts, Post._meta.concrete_fields)
+        insert(Comment, comments, [
+            field for field in Comment._meta.concrete_fields
+            if not field.primary_key
+        ])
+        with connection.cursor() as cursor:
+            # ignore_conflicts молча пропускает уже существующие подписки:
+            # в сводку идут только строки, которые SQLite вставил
+            cursor.execute('SELECT total_changes()')
+            before = cursor.fetchone()[0]
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+            cursor.execute('SELECT total_changes()')
+            followed = cursor.fetchone()[0] - before
+        self.authors.update(post.author_id for post in posts)
+        self.touched_groups.update(
+            post.group_id for post in posts if post.group_id is not None
+        )
+        self.followers.update(follow.user_id for follow in follows)
+        return {
+            'post': len(posts),
+            'comment': len(comments),
+            'follow': followed,
+        }
+
+    def rebuild(self):
+        """Обновляет всё, что считается из постов и подписок."""
+        self.stdout.write('Пересчёт счётчиков, лент и поискового индекса')
+        call_command('recount_posts', stdout=self.stdout)
+        users = set(self.followers)
+        authors = sorted(self.authors)
+        for start in range(0, len(authors), IN_CLAUSE_SIZE):
+            users.update(Follow.objects.filter(
+                author_id__in=authors[start:start + IN_CLAUSE_SIZE]
+            ).values_list('user_id', flat=True))
+        timeline.rebuild(users)
+        with connection.cursor() as cursor:
+            create_index(cursor)
+        bump(
+            [ALL_POSTS]
+            + [author_key(author_id) for author_id in self.authors]
+            + [group_key(group_id) for group_id in self.touched_groups]
+            + [timeline_scope(user_id) for user_id in users]
+        )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from core.sqlite import atomic_write
+
+from posts.counters import actual_counts
+from posts.models import PostCounter
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики постов с таблицей Post и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        with atomic_write():
+            expected = actual_counts()
+            stored = dict(PostCounter.objects.values_list('key', 'value'))
+            drift = {
+                key: expected.get(key, 0)
+                for key in set(expected) | set(stored)
+                if expected.get(key, 0) != stored.get(key, 0)
+            }
+            for key in sorted(drift):
+                self.stdout.write(
+                    f'{key}: {stored.get(key, 0)} -> {drift[key]}'
+                )
+            if not options['dry_run']:
+                stale = [key for key, value in drift.items() if not value]
+                PostCounter.objects.filter(key__in=stale).delete()
+                for key, value in drift.items():
+                    if value:
+                        PostCounter.objects.update_or_create(
+                            key=key, defaults={'value': value}
+                        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Расхождений: {len(drift)}')
+        )
@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_follower_counters(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    db_alias = schema_editor.connection.alias
+    by_author = Follow.objects.using(db_alias).order_by().values_list(
+        'author'
+    )
+    PostCounter.objects.using(db_alias).bulk_create(
+        PostCounter(key=f'followers:{author_id}', value=count)
+        for author_id, count in by_author.annotate(Count('id'))
+    )
+
+
+def drop_follower_counters(apps, schema_editor):
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    PostCounter.objects.using(schema_editor.connection.alias).filter(
+        key__startswith='followers:'
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_follower_counters, drop_follower_counters),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:23
+
+import hashlib
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def fill_image_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    db_alias = schema_editor.connection.alias
+    by_image = Post.objects.using(db_alias).order_by().exclude(
+        image=''
+    ).values_list('image')
+    PostCounter.objects.using(db_alias).bulk_create(
+        PostCounter(
+            key='image:' + hashlib.md5(name.encode()).hexdigest(),
+            value=count,
+        )
+        for name, count in by_image.annotate(Count('id'))
+    )
+
+
+def drop_image_counters(apps, schema_editor):
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    PostCounter.objects.using(schema_editor.connection.alias).filter(
+        key__startswith='image:'
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_updated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_image_counters, drop_image_counters),
+    ]
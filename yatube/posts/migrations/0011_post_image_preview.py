@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:05
+
+from base64 import b64encode
+from io import BytesIO
+
+from django.db import migrations, models
+from PIL import Image, ImageOps
+
+# копия posts.uploads.image_preview на момент миграции: код приложения
+# меняется, а миграция должна проигрываться как раньше
+PREVIEW_SIDE = 20
+TRANSPOSED = {5, 6, 7, 8}
+
+
+def image_preview(file):
+    image = Image.open(file)
+    width, height = image.size
+    if image.getexif().get(0x0112) in TRANSPOSED:
+        width, height = height, width
+    image.draft('RGB', (PREVIEW_SIDE, PREVIEW_SIDE))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((PREVIEW_SIDE, PREVIEW_SIDE))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image)
+        image = background
+    preview = BytesIO()
+    image.convert('RGB').save(preview, 'JPEG', quality=60)
+    encoded = b64encode(preview.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{encoded}'
+
+
+def fill_image_previews(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    storage = Post._meta.get_field('image').storage
+    db_alias = schema_editor.connection.alias
+    posts = Post.objects.using(db_alias).order_by().exclude(image='')
+    # одинаковые картинки хранятся одним файлом
+    for name in list(posts.values_list('image', flat=True).distinct()):
+        try:
+            with storage.open(name) as file:
+                width, height, preview = image_preview(file)
+        except Exception:
+            continue
+        posts.filter(image=name).update(
+            image_width=width, image_height=height, image_preview=preview
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_preview',
+            field=models.TextField(blank=True, editable=False, verbose_name='Превью картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(fill_image_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpost',
+            name='text_excerpt',
+            field=models.CharField(blank=True, max_length=30, verbose_name='Начало текста'),
+        ),
+        migrations.AddField(
+            model_name='archivedpost',
+            name='text_html',
+            field=models.TextField(blank=True, verbose_name='Текст поста в HTML'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=30, verbose_name='Начало текста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текст поста в HTML'),
+        ),
+    ]
@@ -1,6 +1,10 @@
+from collections import Counter
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
+from .rendering import fill_rendered_text, post_body, post_excerpt
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -14,6 +18,33 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create не вызывает сигналы: счётчики и поколения кеша
+        # обновляем сами
+        from .counters import change_counters, image_key, post_keys
+        from .generations import bump
+        from .uploads import fill_image_preview
+
+        objs = list(objs)
+        for post in objs:
+            if post.image and not post.image_preview:
+                fill_image_preview(post)
+            fill_rendered_text(post)
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            deltas = {}
+            images = Counter()
+            for post in objs:
+                for key in post_keys(post.author_id, post.group_id):
+                    deltas[key] = deltas.get(key, 0) + 1
+                if post.image:
+                    images[image_key(post.image.name)] += 1
+            change_counters({**deltas, **images})
+            bump(deltas)
+        return objs
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -23,6 +54,10 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -42,14 +77,74 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # заполняются при загрузке картинки, см. uploads.fill_image_preview
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_preview = models.TextField(
+        'Превью картинки',
+        blank=True,
+        editable=False
+    )
+    # заполняются при сохранении, см. rendering.fill_rendered_text
+    text_html = models.TextField(
+        'Текст поста в HTML',
+        blank=True,
+        editable=False
+    )
+    text_excerpt = models.CharField(
+        'Начало текста',
+        max_length=30,
+        blank=True,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text
 
+    @property
+    def body(self):
+        return post_body(self)
+
+    @property
+    def excerpt(self):
+        return post_excerpt(self)
+
+    def save(self, *args, **kwargs):
+        # счётчики постов обновляются в post_save в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ("-pub_date",)
+        # ленты идут по ключу (pub_date, id) от новых постов к старым
+        indexes = [
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_date_id_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -77,6 +172,11 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            models.Index(
+                fields=['post', '-created'], name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -97,3 +197,155 @@ class Follow(models.Model):
         ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class PostCounter(models.Model):
+    key = models.CharField('Ключ', max_length=64, unique=True)
+    value = models.IntegerField('Значение', default=0)
+
+    def __str__(self):
+        return f'{self.key}={self.value}'
+
+    class Meta:
+        verbose_name = 'Счётчик постов'
+        verbose_name_plural = 'Счётчики постов'
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'post'], name='unique_timeline_post')
+        ]
+        indexes = [
+            # post_id разбивает совпадения pub_date в курсоре ленты
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_post_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+
+class ArchivedPost(models.Model):
+    """Пост старше POST_ARCHIVE_DAYS, перенесённый из Post.
+
+    id остаётся прежним, поэтому адрес поста не меняется. Архивный пост
+    только читается: его не редактируют и не комментируют.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField('Текст поста')
+    pub_date = models.DateTimeField('Дата публикации')
+    updated = models.DateTimeField('Дата изменения')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        verbose_name='Группа'
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        blank=True
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True
+    )
+    image_preview = models.TextField('Превью картинки', blank=True)
+    text_html = models.TextField('Текст поста в HTML', blank=True)
+    text_excerpt = models.CharField(
+        'Начало текста', max_length=30, blank=True
+    )
+    archived = models.DateTimeField('Дата переноса в архив', auto_now_add=True)
+
+    def __str__(self):
+        return self.text
+
+    @property
+    def body(self):
+        return post_body(self)
+
+    @property
+    def excerpt(self):
+        return post_excerpt(self)
+
+    class Meta:
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='archived_author_date_idx',
+            ),
+        ]
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+    )
+    text = models.TextField('Текст комментария')
+    created = models.DateTimeField('Дата публикации')
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='archived_comment_post_idx',
+            ),
+        ]
+        verbose_name = 'Архивный комментарий'
+        verbose_name_plural = 'Архивные комментарии'
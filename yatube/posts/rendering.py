@@ -0,0 +1,27 @@
+from django.template.defaultfilters import linebreaksbr, truncatechars
+from django.utils.safestring import mark_safe
+
+# длина заголовка страницы поста, как было у truncatechars:30
+EXCERPT_LENGTH = 30
+
+
+def render_text(text):
+    """Текст поста как в шаблоне с linebreaksbr: экранирован, с <br>."""
+    return str(linebreaksbr(text, autoescape=True))
+
+
+def fill_rendered_text(post):
+    """Записывает в пост готовый HTML текста и его начало для заголовка."""
+    post.text_html = render_text(post.text)
+    post.text_excerpt = truncatechars(post.text, EXCERPT_LENGTH)
+
+
+def post_body(post):
+    # посты до backfill_rendered_text рендерятся при чтении
+    if post.text_html:
+        return mark_safe(post.text_html)
+    return linebreaksbr(post.text, autoescape=True)
+
+
+def post_excerpt(post):
+    return post.text_excerpt or truncatechars(post.text, EXCERPT_LENGTH)
@@ -0,0 +1,169 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .utils import CursorPage, CursorPaginator
+
+# внешнее содержимое: текст хранится только в posts_post, индекс FTS5
+# держит лишь токены и ссылается на строки по id
+FTS_TABLE = 'posts_post_fts'
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+)
+# маркеры подсветки в snippet, в HTML они меняются на <mark>
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 16
+
+
+def create_index(cursor):
+    """Создаёт индекс FTS5 с триггерами и индексирует все посты."""
+    cursor.execute(CREATE_TABLE)
+    for trigger in TRIGGERS:
+        cursor.execute(trigger)
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+    )
+
+
+def drop_triggers(cursor):
+    """Отключает обновление индекса; вернуть его - create_index."""
+    for trigger in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+
+
+def drop_index(cursor):
+    drop_triggers(cursor)
+    cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def install_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Возвращает триггеры индекса после migrate.
+
+    Миграции SQLite, меняющие posts_post, пересоздают таблицу, и её
+    триггеры пропадают вместе со старой таблицей.
+    """
+    with connections[using].cursor() as cursor:
+        if FTS_TABLE not in connections[using].introspection.table_names(
+            cursor
+        ):
+            return
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение MATCH FTS5 или None.
+
+    Синтаксис FTS5 пользователю не доступен: каждое слово берётся
+    в кавычки, все слова обязательны, последнее ищется как префикс.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids(match):
+    """Подзапрос id постов, подходящих под выражение MATCH."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,),
+    )
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def encode_cursor(post):
+    """Курсор результата поиска в виде `<rank>_<id>`."""
+    return f'{post.rank!r}_{post.pk}'
+
+
+def decode_cursor(value):
+    try:
+        rank, pk = value.split('_')
+        return float(rank), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+class SearchPage(CursorPage):
+    encode_cursor = staticmethod(encode_cursor)
+
+
+class SearchPaginator(CursorPaginator):
+    """Результаты поиска по релевантности (bm25), лучшие первыми.
+
+    Страница - один запрос к индексу `WHERE (rank, id) > курсор
+    LIMIT per_page + 1` и один запрос постов по найденным id.
+    У постов страницы есть `rank` и подсвеченный `snippet`.
+    Ранг зависит от всего индекса, поэтому новые посты могут немного
+    сдвинуть уже выданные страницы.
+    """
+
+    page_class = SearchPage
+    decode_cursor = staticmethod(decode_cursor)
+
+    def __init__(self, query, object_list, per_page, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.match = match_expression(query)
+
+    def fetch(self, key, forward, limit):
+        if self.match is None:
+            return []
+        op, order = ('>', 'ASC') if forward else ('<', 'DESC')
+        where = ''
+        params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, self.match]
+        if key is not None:
+            rank, pk = key
+            where = f'AND (rank {op} %s OR (rank = %s AND rowid {op} %s))'
+            params += [rank, rank, pk]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, rank, '
+                f'snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {where} '
+                f'ORDER BY rank {order}, rowid {order} LIMIT %s',
+                params + [limit],
+            )
+            rows = cursor.fetchall()
+        posts = self.object_list.in_bulk([pk for pk, _, _ in rows])
+        found = []
+        for pk, rank, snippet in rows:
+            # пост могли удалить между запросами
+            if pk in posts:
+                post = posts[pk]
+                post.rank = rank
+                post.snippet = highlight(snippet)
+                found.append(post)
+        return found
@@ -0,0 +1,174 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_save
+)
+from django.dispatch import receiver
+
+from . import autocomplete, thumbnails, timeline
+from .counters import (
+    author_key, change_counters, followers_key, image_key, post_keys
+)
+from .generations import GROUPS_SCOPE, bump, post_scope, timeline_scope
+from .models import ArchivedPost, Comment, Follow, Group, Post, User
+from .rendering import fill_rendered_text
+from .uploads import fill_image_preview
+
+
+def loaded_keys(instance):
+    # отложенные поля не трогаем, иначе post_init сделает лишний запрос
+    fields = instance.__dict__
+    if 'author_id' not in fields or 'group_id' not in fields:
+        return None
+    return post_keys(fields['author_id'], fields['group_id'])
+
+
+@receiver(post_init, sender=Post)
+def remember_post_owner(sender, instance, **kwargs):
+    # запоминаем автора и группу, чтобы заметить их смену при сохранении
+    instance._counted_keys = loaded_keys(instance) if instance.pk else []
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_keys = post_keys(instance.author_id, instance.group_id)
+    old_keys = [] if created else instance._counted_keys
+    if old_keys is None:
+        old_keys = new_keys
+    deltas = {key: 1 for key in new_keys}
+    for key in old_keys:
+        deltas[key] = deltas.get(key, 0) - 1
+    change_counters(deltas)
+    # поколения кеша лент: старые и новые автор и группа
+    bump(set(old_keys) | set(new_keys) | {post_scope(instance.id)})
+    instance._counted_keys = new_keys
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_image(sender, instance, **kwargs):
+    # None - поле не загружено, и прежний файл неизвестен
+    if not instance.pk:
+        instance._image_name = ''
+    elif 'image' in instance.__dict__:
+        image = instance.__dict__['image']
+        instance._image_name = getattr(image, 'name', image) or ''
+    else:
+        instance._image_name = None
+
+
+@receiver(pre_save, sender=Post)
+def preview_post_image(sender, instance, raw=False, **kwargs):
+    # картинку, не загруженную из базы, никто не менял
+    if raw or instance._image_name is None:
+        return
+    if instance.image.name != instance._image_name:
+        fill_image_preview(instance)
+
+
+@receiver(pre_save, sender=Post)
+def render_post_text(sender, instance, raw=False, **kwargs):
+    # отложенный text не загружаем: такой пост сохраняют не ради текста
+    if not raw and 'text' in instance.__dict__:
+        fill_rendered_text(instance)
+
+
+@receiver(post_save, sender=Post)
+def track_post_image(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_name = '' if created else instance._image_name
+    new_name = instance.image.name or ''
+    if old_name is None or old_name == new_name:
+        return
+    deltas = {}
+    if new_name:
+        deltas[image_key(new_name)] = 1
+    if old_name:
+        deltas[image_key(old_name)] = -1
+    change_counters(deltas)
+    if old_name:
+        thumbnails.release_image(old_name)
+    if new_name:
+        thumbnails.schedule_thumbnails(instance)
+    instance._image_name = new_name
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    keys = instance._counted_keys
+    if keys is None:
+        keys = post_keys(instance.author_id, instance.group_id)
+    change_counters({key: -1 for key in keys})
+    bump(keys + [post_scope(instance.id)])
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    name = instance._image_name
+    if name is None:
+        name = instance.image.name
+    if name:
+        change_counters({image_key(name): -1})
+        thumbnails.release_image(name)
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def count_deleted_archived_post(sender, instance, **kwargs):
+    # архивный пост учтён только в счётчиках автора и картинки
+    deltas = {author_key(instance.author_id): -1}
+    if instance.image:
+        deltas[image_key(instance.image.name)] = -1
+    change_counters(deltas)
+    if instance.image:
+        thumbnails.release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counters({followers_key(instance.author_id): 1})
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump([timeline_scope(instance.user_id)])
+
+
+@receiver(post_delete, sender=Follow)
+def trim_unfollowed(sender, instance, **kwargs):
+    change_counters({followers_key(instance.author_id): -1})
+    timeline.drop_author(instance.user_id, instance.author_id)
+    # автор мог перестать быть популярным: его посты снова в лентах
+    readers = timeline.unpull(instance.author_id)
+    bump([
+        timeline_scope(user_id)
+        for user_id in {instance.user_id, *readers}
+    ])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump([post_scope(instance.post_id)])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump([GROUPS_SCOPE])
+
+
+# индекс автодополнения обновляется сразу, а не после коммита: запись
+# откаченной транзакции проживёт в нём до пересборки
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=User)
+def index_name(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.update_entry(instance)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def unindex_name(sender, instance, **kwargs):
+    autocomplete.remove_entry(instance)
@@ -0,0 +1,40 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Имя файла - хеш содержимого, одинаковые файлы хранятся один раз.
+
+    Миниатюры sorl именуются по имени исходника, поэтому у постов
+    с одной и той же картинкой они тоже общие. Удаляет файлы
+    thumbnails.release_image, когда на них не ссылается ни один пост.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return '/'.join(
+            part for part in
+            (directory, digest[:2], digest[2:4], digest + extension)
+            if part
+        )
@@ -0,0 +1,72 @@
+from django import template
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from ..cards import render_cards
+from ..generations import count_fragment
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        value = cache.get(key)
+        count_fragment(hit=value is not None)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value, None)
+        return value
+
+
+@register.tag
+def feed_cache(parser, token):
+    """Бессрочный кеш фрагмента ленты.
+
+    {% feed_cache name feed_version [vary_on ...] %}...{% endfeed_cache %}
+
+    `feed_version` - поколения областей ленты из posts.generations;
+    при изменении постов поколение растёт, и старый фрагмент
+    больше не читается.
+    """
+    nodelist = parser.parse(('endfeed_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 2 arguments."
+        )
+    return FeedCacheNode(
+        nodelist,
+        bits[1],
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
+
+
+@register.filter
+def page_key(page):
+    """Часть ключа фрагмента, по которой различаются страницы ленты.
+
+    Берётся из самой страницы, а не из адреса запроса: посторонние
+    параметры (?utm=...), битые курсоры и номера страниц за концом
+    ленты не плодят новых бессрочных фрагментов.
+    """
+    if getattr(page, 'cursor_mode', False):
+        # пустая страница за концом ленты тоже has_previous
+        return (
+            f'{page.has_previous()}:{page.previous_cursor}:'
+            f'{page.next_cursor}'
+        )
+    return f'page:{page.number}'
+
+
+@register.filter
+def post_cards(posts):
+    """Закешированные карточки постов страницы."""
+    return render_cards(posts)
@@ -0,0 +1,18 @@
+from django import template
+
+from ..thumbnails import image_sources
+
+register = template.Library()
+
+
+@register.filter
+def responsive_image(post, name):
+    """Варианты миниатюры для <picture> или None, пока их делает фон.
+
+    Если варианты уже разложены по постам страницы
+    (thumbnails.attach_image_sources), отдельного поиска не будет.
+    """
+    attached = getattr(post, 'image_sources', {})
+    if name in attached:
+        return attached[name]
+    return image_sources(post.image, name)
@@ -1,13 +1,16 @@
+import io
 import shutil
 import tempfile
 
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..forms import CommentForm
 from ..models import Comment, Group, Post
@@ -135,6 +138,94 @@ class PostModelTest(TestCase):
         )
         self.assertEqual(Post.objects.count(), posts_count)
 
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+    POST_IMAGE_MAX_BYTES=200 * 1024,
+    POST_IMAGE_MAX_PIXELS=4 * 1000 * 1000,
+    POST_IMAGE_MAX_SIDE=800,
+)
+class ImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, size, image_format, **options):
+        content = io.BytesIO()
+        Image.new('RGB', size).save(content, image_format, **options)
+        return self.post_image(
+            f'big.{image_format.lower()}', content.getvalue()
+        )
+
+    def post_image(self, name, content):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(name, content),
+            },
+        )
+
+    def test_large_image_shrunk_at_upload(self):
+        """Картинка больше лимита по стороне уменьшается при загрузке."""
+        self.upload((1600, 1000), 'JPEG')
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.image.width, post.image.height), (800, 500)
+        )
+
+    def test_shrunk_image_follows_exif_orientation(self):
+        """Уменьшенное фото с телефона повёрнуто по EXIF Orientation."""
+        exif = Image.Exif()
+        # 6 - повернуть на 90 градусов по часовой стрелке
+        exif[0x0112] = 6
+        self.upload((1600, 1000), 'JPEG', exif=exif)
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.image.width, post.image.height), (500, 800)
+        )
+
+    def test_unwritable_format_saved_as_jpeg(self):
+        """Формат, который Pillow не пишет, уменьшается в JPEG."""
+        content = io.BytesIO()
+        Image.new('RGB', (1600, 1000)).save(content, 'GIF')
+        with mock.patch.dict(Image.SAVE):
+            del Image.SAVE['GIF']
+            response = self.post_image('big.gif', content.getvalue())
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpeg'))
+        self.assertEqual(
+            (post.image.width, post.image.height), (800, 500)
+        )
+
+    def test_limits_rejected(self):
+        """Слишком тяжёлый файл или картинка в форме отклоняются."""
+        cases = {
+            # 2500x2000 - больше 4 мегапикселей, но весит немного
+            'мегапикселей': ((2500, 2000), 'PNG'),
+            'МБ': ((600, 600), 'BMP'),
+        }
+        for message, (size, image_format) in cases.items():
+            with self.subTest(message=message):
+                response = self.upload(size, image_format)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn(
+                    message, response.context['form'].errors['image'][0]
+                )
+                self.assertFalse(Post.objects.exists())
+
+
 class CommentModelTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,7 +1,28 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-from ..models import Group, Post
+from ..counters import (
+    ALL_POSTS, actual_counts, author_key, get_count, get_counts, group_key,
+    image_key
+)
+from ..models import ArchivedPost, Comment, Follow, Group, Post, PostCounter
+from ..search import match_expression, matching_ids
+from ..thumbnails import (
+    delete_unused_image, generate_thumbnails, image_sources,
+    thumbnails_version
+)
 
 User = get_user_model()
 
@@ -64,3 +85,408 @@ class GroupModelTest(TestCase):
         group = GroupModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class PostCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other_slag',
+            description='Тестовое описание',
+        )
+
+    def assertCounts(self, expected):
+        self.assertEqual(get_counts(list(expected)), expected)
+
+    def test_counters_follow_post_changes(self):
+        """Счётчики меняются при создании, смене группы и удалении поста."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        self.assertCounts({
+            ALL_POSTS: 1,
+            author_key(self.user.id): 1,
+            group_key(self.group.id): 1,
+        })
+        post = Post.objects.get(id=post.id)
+        post.group = self.other_group
+        post.save()
+        self.assertCounts({
+            ALL_POSTS: 1,
+            group_key(self.group.id): 0,
+            group_key(self.other_group.id): 1,
+        })
+        post.delete()
+        self.assertCounts({
+            ALL_POSTS: 0,
+            author_key(self.user.id): 0,
+            group_key(self.other_group.id): 0,
+        })
+
+    def test_bulk_create_updates_counters(self):
+        """bulk_create тоже учитывается в счётчиках."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=str(i), group=self.group)
+            for i in range(3)
+        )
+        self.assertCounts({
+            ALL_POSTS: 3,
+            author_key(self.user.id): 3,
+            group_key(self.group.id): 3,
+        })
+
+    def test_recount_posts_fixes_drift(self):
+        """Команда recount_posts исправляет рассинхронизацию."""
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        PostCounter.objects.filter(key=ALL_POSTS).update(value=42)
+        PostCounter.objects.create(key=group_key(self.group.id), value=7)
+        call_command('recount_posts', stdout=StringIO())
+        self.assertCounts({
+            ALL_POSTS: 1,
+            author_key(self.user.id): 1,
+            group_key(self.group.id): 0,
+        })
+
+
+class ContentAddressedImageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        # записи key-value store sorl живут в кеше, а одинаковые картинки
+        # разных тестов получают одно имя файла
+        cache.clear()
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def gif(self, name, color=b'\x00'):
+        return SimpleUploadedFile(
+            name,
+            b'GIF89a\x01\x00\x01\x00\x80\x00\x00' + color * 3
+            + b'\xff\xff\xff!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00'
+            b'\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;',
+            'image/gif',
+        )
+
+    def files(self, directory):
+        return [
+            name
+            for _, _, names in os.walk(
+                os.path.join(settings.MEDIA_ROOT, directory)
+            )
+            for name in names
+        ]
+
+    def test_same_content_stored_once(self):
+        """Одинаковые картинки - один файл и общие миниатюры."""
+        first, second = (
+            Post.objects.create(
+                author=self.user, text=str(i), image=self.gif(f'{i}.gif')
+            )
+            for i in range(2)
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(get_count(image_key(first.image.name)), 2)
+        self.assertEqual(len(self.files('posts')), 1)
+        generate_thumbnails(first.image)
+        thumbnails = self.files('cache')
+        generate_thumbnails(second.image)
+        self.assertEqual(self.files('cache'), thumbnails)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл и миниатюры удаляются с последним постом, где они есть."""
+        posts = [
+            Post.objects.create(
+                author=self.user, text=str(i), image=self.gif('same.gif')
+            )
+            for i in range(2)
+        ]
+        image = posts[0].image
+        name = image.name
+        generate_thumbnails(image)
+        self.assertTrue(self.files('cache'))
+
+        posts[0].delete()
+        delete_unused_image(name)
+        self.assertTrue(image.storage.exists(name))
+
+        # замена картинки тоже освобождает ссылку
+        posts[1].image = self.gif('other.gif', color=b'\xff')
+        posts[1].save()
+        self.assertEqual(get_count(image_key(name)), 0)
+        delete_unused_image(name)
+        self.assertFalse(image.storage.exists(name))
+        self.assertFalse(PostCounter.objects.filter(key=image_key(name)))
+        self.assertEqual(self.files('cache'), [])
+
+    def test_preview_stored_with_image(self):
+        """Размеры и превью картинки пишутся в пост при загрузке."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.gif('preview.gif')
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (1, 1))
+        self.assertTrue(
+            post.image_preview.startswith('data:image/jpeg;base64,')
+        )
+        post.image = ''
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_preview, '')
+
+    def test_backfill_thumbnails_resumes_from_checkpoint(self):
+        """backfill_thumbnails продолжает с сохранённого места."""
+        first, second = (
+            Post.objects.create(
+                author=self.user,
+                text=str(i),
+                image=self.gif(f'{i}.gif', color=bytes([i])),
+            )
+            for i in range(2)
+        )
+        checkpoint = os.path.join(settings.MEDIA_ROOT, 'checkpoint.json')
+        with open(checkpoint, 'w') as file:
+            json.dump(
+                {'version': thumbnails_version(), 'last_id': first.id}, file
+            )
+        call_command(
+            'backfill_thumbnails',
+            workers=0,
+            checkpoint=checkpoint,
+            stdout=StringIO(),
+        )
+        self.assertIsNone(image_sources(first.image, 'card'))
+        self.assertIsNotNone(image_sources(second.image, 'card'))
+        with open(checkpoint) as file:
+            self.assertEqual(json.load(file)['last_id'], second.id)
+
+        call_command(
+            'backfill_thumbnails',
+            workers=0,
+            checkpoint=checkpoint,
+            restart=True,
+            stdout=StringIO(),
+        )
+        self.assertIsNotNone(image_sources(first.image, 'card'))
+
+    def test_backfill_thumbnails_covers_archive(self):
+        """Миниатюры делаются и для картинок архивных постов."""
+        post = Post.objects.create(
+            author=self.user, text='Старый', image=self.gif('old.gif')
+        )
+        Post.objects.filter(id=post.id).update(
+            pub_date=timezone.now() - datetime.timedelta(
+                days=settings.POST_ARCHIVE_DAYS + 1
+            )
+        )
+        call_command('archive_posts', batch_size=1, stdout=StringIO())
+        archived = ArchivedPost.objects.get(id=post.id)
+        cache.clear()
+        call_command(
+            'backfill_thumbnails',
+            workers=0,
+            restart=True,
+            checkpoint=os.path.join(settings.MEDIA_ROOT, 'checkpoint.json'),
+            stdout=StringIO(),
+        )
+        self.assertIsNotNone(image_sources(archived.image, 'card'))
+
+
+class ImportContentTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'content.jsonl')
+        self.checkpoint = os.path.join(directory, 'checkpoint.json')
+
+    def write_lines(self, *records, mode='w'):
+        with open(self.path, mode, encoding='utf-8') as file:
+            for record in records:
+                file.write(f'{json.dumps(record)}\n')
+
+    def import_content(self, **options):
+        options.setdefault('stdout', StringIO())
+        options.setdefault('stderr', StringIO())
+        call_command(
+            'import_content', self.path, checkpoint=self.checkpoint, **options
+        )
+
+    def test_import_keeps_dates_and_rebuilds_counters(self):
+        """Импорт сохраняет даты и пересчитывает счётчики и ленты."""
+        self.write_lines(
+            {'type': 'follow', 'user': 'auth', 'author': 'writer'},
+            {
+                'type': 'post',
+                'author': 'writer',
+                'text': 'Импортированный пост',
+                'group': 'test_slag',
+                'pub_date': '2020-01-02T03:04:05+00:00',
+                'comments': [{'author': 'auth', 'text': 'Комментарий'}],
+            },
+            {'type': 'post', 'author': 'writer', 'group': 'unknown'},
+        )
+        self.import_content()
+        post = Post.objects.get()
+        self.assertEqual(post.author.username, 'writer')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comments.get().author, self.user)
+        self.assertEqual(get_counts([ALL_POSTS, group_key(self.group.id)]), {
+            ALL_POSTS: 1,
+            group_key(self.group.id): 1,
+        })
+        self.assertTrue(self.user.timeline.filter(post=post).exists())
+        self.assertTrue(Post.objects.filter(
+            pk__in=matching_ids(match_expression('импортированный'))
+        ).exists())
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск импортирует только новые строки."""
+        self.write_lines({'type': 'post', 'author': 'auth', 'text': '1'})
+        self.import_content()
+        self.write_lines(
+            {'type': 'post', 'author': 'auth', 'text': '2'}, mode='a'
+        )
+        self.import_content()
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)), ['1', '2']
+        )
+
+    def test_rows_with_wrong_types_skipped(self):
+        """null вместо текста пропускает строку, а не всю пачку."""
+        self.write_lines(
+            {'type': 'post', 'author': 'auth', 'text': None},
+            {
+                'type': 'post',
+                'author': 'auth',
+                'text': 'С комментарием',
+                'comments': [{'author': 'auth', 'text': None}],
+            },
+            {'type': 'follow', 'user': 'auth', 'author': 1},
+            {'type': 'post', 'author': 'auth', 'text': 'Пост'},
+        )
+        stderr = StringIO()
+        self.import_content(stderr=stderr)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Пост']
+        )
+        self.assertEqual(stderr.getvalue().count('пропущена'), 3)
+
+    def test_existing_follows_not_counted(self):
+        writer = User.objects.create_user(username='writer')
+        Follow.objects.create(user=self.user, author=writer)
+        self.write_lines(
+            {'type': 'follow', 'user': 'auth', 'author': 'writer'},
+            {'type': 'follow', 'user': 'writer', 'author': 'auth'},
+        )
+        stdout = StringIO()
+        self.import_content(stdout=stdout)
+        self.assertIn('подписок 1,', stdout.getvalue())
+
+    def test_dry_run_writes_nothing(self):
+        self.write_lines({'type': 'post', 'author': 'new', 'text': '1'})
+        self.import_content(dry_run=True)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+
+class ArchivePostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+
+    def test_old_posts_moved_with_comments(self):
+        """Старые посты с комментариями уходят в архив, новые остаются."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        old, new = (
+            Post.objects.create(
+                author=self.user, group=self.group, text=text
+            )
+            for text in ('Старый пост', 'Новый пост')
+        )
+        Post.objects.filter(id=old.id).update(
+            pub_date=timezone.now() - datetime.timedelta(
+                days=settings.POST_ARCHIVE_DAYS + 1
+            )
+        )
+        Comment.objects.create(post=old, author=self.user, text='Коммент')
+        call_command('archive_posts', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(Post.objects.all()), [new])
+        archived = ArchivedPost.objects.get()
+        self.assertEqual(archived.id, old.id)
+        self.assertEqual(archived.comments.get().text, 'Коммент')
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(self.follower.timeline.filter(post=old.id).exists())
+        # лента и группа без архива, автор - с ним
+        self.assertEqual(get_counts([
+            ALL_POSTS, group_key(self.group.id), author_key(self.user.id)
+        ]), {
+            ALL_POSTS: 1,
+            group_key(self.group.id): 1,
+            author_key(self.user.id): 2,
+        })
+        counters = dict(PostCounter.objects.values_list('key', 'value'))
+        for key, value in actual_counts().items():
+            self.assertEqual(counters.get(key, 0), value, key)
+
+
+class RenderedTextTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def test_text_rendered_on_save(self):
+        """HTML текста и начало текста сохраняются вместе с постом."""
+        post = Post.objects.create(
+            author=self.user, text='<b>Первая</b>\nвторая строка поста'
+        )
+        post = Post.objects.get(id=post.id)
+        self.assertEqual(
+            post.text_html,
+            '&lt;b&gt;Первая&lt;/b&gt;<br>вторая строка поста',
+        )
+        self.assertEqual(post.text_excerpt, '<b>Первая</b>\nвторая строка п…')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(Post.objects.get(id=post.id).body, 'Новый текст')
+
+    def test_backfill_rendered_text(self):
+        post = Post.objects.create(author=self.user, text='а\nб')
+        Post.objects.filter(id=post.id).update(text_html='', text_excerpt='')
+        self.assertEqual(Post.objects.get(id=post.id).body, 'а<br>б')
+        call_command('backfill_rendered_text', stdout=StringIO())
+        post = Post.objects.get(id=post.id)
+        self.assertEqual(post.text_html, 'а<br>б')
+        self.assertEqual(post.excerpt, 'а\nб')
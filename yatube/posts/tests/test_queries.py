@@ -0,0 +1,215 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..search import FTS_TABLE
+from ..urls import urlpatterns
+
+User = get_user_model()
+
+# шаг плана без индекса: "SCAN posts_post", в старых SQLite "SCAN TABLE"
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+( AS \S+)?$')
+
+
+class QueryBudgetMixin:
+    """Проверка, что запрос укладывается в бюджет @query_budget вьюхи."""
+
+    def assertWithinQueryBudget(self, client, method, url, data=None):
+        budget = getattr(resolve(url).func, 'query_budget', None)
+        self.assertIsNotNone(budget, f'{url}: не объявлен @query_budget')
+        with CaptureQueriesContext(connection) as queries:
+            getattr(client, method)(url, data)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f'{url}: {len(queries)} запросов при бюджете {budget}\n'
+            + '\n'.join(query['sql'] for query in queries),
+        )
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def fill(self, amount):
+        """Доводит число постов и комментариев автора до `amount`."""
+        missing = amount - Post.objects.count()
+        Post.objects.bulk_create(
+            Post(author=self.author, group=self.group, text=str(i))
+            for i in range(missing)
+        )
+        post = Post.objects.latest('pub_date')
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.user, text=str(i))
+            for i in range(amount - post.comments.count())
+        )
+        return post
+
+    def requests(self, post):
+        own_post = Post.objects.filter(author=self.user).first()
+        author = {'username': self.author.username}
+        return (
+            ('get', reverse('posts:index'), None),
+            ('get', reverse('posts:group_list', args=[self.group.slug]),
+             None),
+            ('get', reverse('posts:profile', kwargs=author), None),
+            ('get', reverse('posts:post_detail', args=[post.id]), None),
+            ('get', reverse('posts:post_create'), None),
+            ('post', reverse('posts:post_create'), {'text': 'Новый пост'}),
+            ('get', reverse('posts:post_edit', args=[own_post.id]), None),
+            ('post', reverse('posts:post_edit', args=[own_post.id]),
+             {'text': 'Изменённый пост', 'group': self.group.id}),
+            ('post', reverse('posts:add_comment', args=[post.id]),
+             {'text': 'Комментарий'}),
+            ('get', reverse('posts:profile_follow', kwargs=author), None),
+            ('get', reverse('posts:follow_index'), None),
+            ('get', reverse('posts:search'), {'q': '1'}),
+            ('get', reverse('posts:autocomplete'), {'q': 'a'}),
+            ('get', reverse('posts:profile_export', kwargs=author), None),
+            ('get', reverse('posts:group_export', args=[self.group.slug]),
+             {'format': 'csv'}),
+            ('get', reverse('posts:profile_unfollow', kwargs=author), None),
+        )
+
+    def test_every_url_declares_budget(self):
+        """У каждой вьюхи из posts/urls.py объявлен @query_budget."""
+        for pattern in urlpatterns:
+            with self.subTest(url=pattern.name):
+                self.assertTrue(hasattr(pattern.callback, 'query_budget'))
+
+    def test_views_fit_query_budget(self):
+        """Число запросов не растёт с числом постов и комментариев."""
+        Post.objects.create(author=self.user, text='Свой пост')
+        for amount in (1, 10, 1000):
+            post = self.fill(amount)
+            for method, url, data in self.requests(post):
+                with self.subTest(amount=amount, method=method, url=url):
+                    self.assertWithinQueryBudget(
+                        self.authorized_client, method, url, data
+                    )
+
+    def test_follow_index_with_many_pulled_authors(self):
+        """Посты популярных авторов читаются одним запросом на всех."""
+        url = reverse('posts:follow_index')
+        counts = []
+        authors = 0
+        with override_settings(TIMELINE_FANOUT_LIMIT=0):
+            for amount in (1, 5, 20):
+                for i in range(authors, amount):
+                    author = User.objects.create_user(username=f'popular{i}')
+                    Post.objects.create(author=author, text=str(i))
+                    Follow.objects.create(user=self.user, author=author)
+                authors = amount
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_client.get(url)
+                counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент и комментариев идут по индексам без сортировки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(settings.MAX_PAGE_AMOUNT * 2)
+        )
+        cls.post = Post.objects.latest('pub_date')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=str(i))
+            for i in range(3)
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        # из кеша фрагментов страницы собирались бы без запросов
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndexes(self, url, data=None, sorted_tables=()):
+        """Запросы страницы идут по индексам и без сортировки.
+
+        Для таблиц из `sorted_tables` сортировка разрешена, полный
+        просмотр - нет.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url, data)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            sorted_query = any(
+                f'FROM {table} ' in query['sql'] for table in sorted_tables
+            )
+            for step in self.plan(query['sql']):
+                with self.subTest(url=url, data=data, sql=query['sql']):
+                    if not sorted_query:
+                        self.assertNotIn('TEMP B-TREE', step)
+                    self.assertIsNone(FULL_SCAN.match(step), step)
+        return response
+
+    def test_feeds_use_indexes(self):
+        """Все страницы лент читаются по индексам."""
+        feeds = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:follow_index'),
+        )
+        for url in feeds:
+            response = self.assertUsesIndexes(url)
+            cursor = response.context['page_obj'].next_cursor
+            self.assertIsNotNone(cursor)
+            self.assertUsesIndexes(url, {'after': cursor})
+            self.assertUsesIndexes(url, {'before': cursor})
+            self.assertUsesIndexes(url, {'page': 2})
+
+    def test_pulled_authors_use_indexes(self):
+        """Посты популярных авторов подмешиваются по индексу."""
+        with override_settings(TIMELINE_FANOUT_LIMIT=0):
+            self.assertUsesIndexes(reverse('posts:follow_index'))
+
+    def test_post_pages_use_indexes(self):
+        """Пост с комментариями и поиск читаются по индексам."""
+        self.assertUsesIndexes(
+            reverse('posts:post_detail', args=[self.post.id])
+        )
+        # ранг bm25 есть только у найденных строк, индекса по нему нет:
+        # FTS5 сортирует совпадения, а rowid нужен курсору при равных rank
+        self.assertUsesIndexes(
+            reverse('posts:search'), {'q': 'пост'}, sorted_tables=[FTS_TABLE]
+        )
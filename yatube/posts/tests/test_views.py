@@ -1,15 +1,31 @@
+import csv
+import datetime
+import gzip
+import io
+import json
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 
-from ..models import Group, Post
+from .. import autocomplete
+from ..archive import ArchiveChain
+from ..counters import author_key, change_counters
+from ..generations import bump, fragment_stats, post_scope
+from ..models import (ArchivedPost, Comment, Follow, Group, Post,
+                      TimelineEntry)
+from ..thumbnails import attach_image_sources, process_post
+from ..utils import decode_cursor, encode_cursor
 
 User = get_user_model()
 
@@ -177,7 +193,639 @@ class PaginatorViewsTest(TestCase):
                 list_test.paginator.count
                 self.assertEqual(POST_ON_FIRST_PAGE, len(list_test))
 
+    def test_cursor_paginator_pages(self):
+        """Keyset-пагинация: вперёд по курсору и обратно."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertTrue(first_page.has_next())
+        self.assertFalse(first_page.has_previous())
+
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': first_page.next_cursor}
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(13 - settings.MAX_PAGE_AMOUNT, len(second_page))
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'before': second_page.previous_cursor}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), list(first_page)
+        )
+
+    def test_cursor_before_epoch(self):
+        """Курсор поста до 1970 года разбирается обратно."""
+        post = Post(id=5, pub_date=datetime.datetime(
+            1960, 5, 1, 12, 30, 0, 15, tzinfo=datetime.timezone.utc
+        ))
+        self.assertEqual(
+            decode_cursor(encode_cursor(post)), (post.pub_date, post.id)
+        )
+        self.assertIsNone(decode_cursor('--5'))
+
     def test_cache(self):
-      # """Тестирование кэширования главной страницы"""
-      #   def response_page():
-        pass
+        """Тестирование кэширования главной страницы"""
+        self.authorized_client.get(reverse('posts:index'))
+        stats = fragment_stats()
+        content = self.authorized_client.get(reverse('posts:index')).content
+        self.assertEqual(fragment_stats()['hits'], stats['hits'] + 1)
+
+        post = Post.objects.filter(author=self.user).first()
+        post.text = 'Изменённый пост'
+        post.save()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(response.content, content)
+        self.assertContains(response, 'Изменённый пост')
+
+    def test_cache_ignores_unrelated_params(self):
+        """Посторонние параметры адреса не создают новых фрагментов."""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        stats = fragment_stats()
+        for data in ({'utm': 'mail'}, {'after': 'битый'}, {'page': 'x'}):
+            with self.subTest(data=data):
+                self.authorized_client.get(url, data)
+        self.assertEqual(fragment_stats()['misses'], stats['misses'] + 1)
+
+    def test_cache_comments_invalidated(self):
+        """Новый комментарий сразу виден на странице поста."""
+        post = Post.objects.filter(author=self.user).first()
+        url = reverse('posts:post_detail', args=[post.id])
+        self.authorized_client.get(url)
+        Comment.objects.create(post=post, author=self.user, text='Новый')
+        self.assertContains(self.authorized_client.get(url), 'Новый')
+
+    def test_comments_cached_per_post(self):
+        """Посты с одним поколением не делят список комментариев."""
+        posts = Post.objects.filter(author=self.user)[:2]
+        for post in posts:
+            Comment.objects.create(
+                post=post, author=self.user, text=f'Коммент {post.id}'
+            )
+        with mock.patch('posts.generations.time.time_ns', return_value=1):
+            bump([post_scope(post.id) for post in posts])
+        first, second = (
+            self.authorized_client.get(
+                reverse('posts:post_detail', args=[post.id])
+            )
+            for post in posts
+        )
+        self.assertContains(first, f'Коммент {posts[0].id}')
+        self.assertContains(second, f'Коммент {posts[1].id}')
+        self.assertNotContains(second, f'Коммент {posts[0].id}')
+
+
+class FollowViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.stranger = User.objects.create_user(username='stranger')
+        cls.post = Post.objects.create(author=cls.author, text='Старый пост')
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        self.stranger_client = Client()
+        self.stranger_client.force_login(self.stranger)
+
+    def follow(self):
+        self.follower_client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+
+    def test_follow_backfills_timeline(self):
+        """После подписки старые посты автора попадают в ленту."""
+        self.follow()
+        self.assertTrue(
+            Follow.objects.filter(
+                user=self.follower, author=self.author
+            ).exists()
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_new_post_fans_out_to_followers_only(self):
+        """Новый пост появляется только в лентах подписчиков."""
+        self.follow()
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        response = self.stranger_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_unfollow_removes_author_posts(self):
+        """После отписки посты автора пропадают из ленты."""
+        self.follow()
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists()
+        )
+
+    def test_cannot_follow_yourself(self):
+        """На себя подписаться нельзя."""
+        client = Client()
+        client.force_login(self.author)
+        client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertFalse(Follow.objects.filter(user=self.author).exists())
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_timeline_is_capped(self):
+        """Лента обрезается до TIMELINE_LENGTH последних постов."""
+        self.follow()
+        posts = [
+            Post.objects.create(author=self.author, text=str(i))
+            for i in range(3)
+        ]
+        entries = TimelineEntry.objects.filter(user=self.follower)
+        self.assertEqual(
+            [entry.post for entry in entries], posts[:-3:-1]
+        )
+
+    def test_popular_author_posts_are_merged_on_read(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        self.follow()
+        with self.settings(TIMELINE_FANOUT_LIMIT=0):
+            new_post = Post.objects.create(author=self.author, text='Новый')
+            self.assertFalse(
+                TimelineEntry.objects.filter(post=new_post).exists()
+            )
+            response = self.follower_client.get(
+                reverse('posts:follow_index')
+            )
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post]
+        )
+
+    def test_author_below_fanout_limit_is_fanned_out_again(self):
+        """Посты автора, переставшего быть популярным, попадают в ленты."""
+        self.follow()
+        Follow.objects.create(user=self.stranger, author=self.author)
+        with self.settings(TIMELINE_FANOUT_LIMIT=1):
+            new_post = Post.objects.create(author=self.author, text='Новый')
+            self.assertFalse(
+                TimelineEntry.objects.filter(post=new_post).exists()
+            )
+            self.stranger_client.get(
+                reverse('posts:profile_unfollow', args=[self.author.username])
+            )
+            self.assertTrue(
+                TimelineEntry.objects.filter(
+                    user=self.follower, post=new_post
+                ).exists()
+            )
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Текст поста')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_card_is_shared_between_feeds(self):
+        """Карточка рендерится один раз для главной и профиля."""
+        self.client.get(reverse('posts:index'))
+        with self.assertTemplateNotUsed('posts/includes/post_card.html'):
+            response = self.client.get(
+                reverse('posts:profile', args=[self.user.username])
+            )
+        self.assertContains(response, 'Текст поста')
+
+    def test_card_rerendered_after_edit(self):
+        """После редактирования поста карточка рендерится заново."""
+        self.client.get(reverse('posts:index'))
+        self.post.text = 'Новый текст'
+        self.post.save()
+        response = self.client.get(
+            reverse('posts:profile', args=[self.user.username])
+        )
+        self.assertContains(response, 'Новый текст')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Текст поста', group=cls.group
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+        )
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившаяся страница отдаёт 304 без рендера шаблона."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                # первый ответ выставляет CSRF-cookie формы комментария
+                self.authorized_client.get(url)
+                response = self.authorized_client.get(url)
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+
+    def test_changed_pages_rendered(self):
+        """После нового комментария страницы отдаются заново."""
+        etags = {
+            url: self.authorized_client.get(url)['ETag']
+            for url in self.urls
+        }
+        Post.objects.create(author=self.user, text='Новый', group=self.group)
+        Comment.objects.create(post=self.post, author=self.user, text='!')
+        for url, value in etags.items():
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=value
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Разные пользователи получают разные ETag."""
+        url = reverse('posts:index')
+        self.assertNotEqual(
+            self.client.get(url)['ETag'],
+            self.authorized_client.get(url)['ETag'],
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_placeholder_until_thumbnail_ready(self):
+        """Запрос не делает миниатюру, до фоновой генерации - превью."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    'thumb.gif', self.gif, 'image/gif'
+                ),
+            },
+        )
+        post = Post.objects.get()
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=[post.id]),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                content = self.client.get(url).content.decode()
+                self.assertIn(post.image_preview, content)
+                self.assertNotIn('img/placeholder.svg', content)
+                self.assertNotIn(settings.MEDIA_URL + 'cache/', content)
+        process_post(post.id)
+        for url in pages:
+            with self.subTest(url=url):
+                content = self.client.get(url).content.decode()
+                self.assertNotIn('img/placeholder.svg', content)
+                self.assertIn(settings.MEDIA_URL + 'cache/', content)
+                self.assertIn('type="image/webp"', content)
+                self.assertIn('loading="lazy"', content)
+                for width in settings.POST_THUMBNAIL_WIDTHS:
+                    self.assertIn(f' {width}w', content)
+
+    def test_page_sources_in_one_get_many(self):
+        """URL миниатюр страницы постов читаются одним get_many."""
+        posts = [
+            Post.objects.create(
+                author=self.user,
+                text=str(i),
+                image=SimpleUploadedFile(f'{i}.gif', self.gif, 'image/gif'),
+            )
+            for i in range(3)
+        ]
+        for post in posts:
+            process_post(post.id)
+        with mock.patch.object(
+            cache, 'get_many', wraps=cache.get_many
+        ) as get_many:
+            attach_image_sources(posts, 'card')
+        # URL ещё не собраны: второй get_many - по записям sorl
+        self.assertEqual(get_many.call_count, 2)
+        posts = list(Post.objects.all())
+        with mock.patch.object(
+            cache, 'get_many', wraps=cache.get_many
+        ) as get_many:
+            attach_image_sources(posts, 'card')
+        self.assertEqual(get_many.call_count, 1)
+        for post in posts:
+            with self.subTest(post=post.text):
+                sources = post.image_sources['card']
+                self.assertEqual(sources['width'], 960)
+                self.assertIn('image/webp', sources['sources'][0]['type'])
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.url = reverse('posts:search')
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        return response.context['page_obj']
+
+    def test_results_ranked_with_snippets(self):
+        """Лучше подходящий пост первый, совпадения подсвечены."""
+        Post.objects.create(author=self.user, text='Мир <b>труд</b> май')
+        best = Post.objects.create(author=self.user, text='мир мир')
+        Post.objects.create(author=self.user, text='Другое')
+        page = self.search('МИР')
+        self.assertEqual([post.id for post in page][0], best.id)
+        self.assertEqual(len(page), 2)
+        self.assertIn('<mark>Мир</mark> &lt;b&gt;труд', page[1].snippet)
+
+    def test_index_follows_edits(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.create(author=self.user, text='старый текст')
+        post.text = 'новый текст'
+        post.save()
+        self.assertEqual(len(self.search('старый')), 0)
+        self.assertEqual(len(self.search('нов')), 1)
+        post.delete()
+        self.assertEqual(len(self.search('новый')), 0)
+
+    def test_cursor_pagination(self):
+        """Результаты листаются курсором без повторов."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text='слово ' * (i + 1))
+            for i in range(settings.MAX_PAGE_AMOUNT + 3)
+        )
+        first = self.search('слово')
+        self.assertTrue(first.has_next())
+        second = self.search('слово', after=first.next_cursor)
+        self.assertFalse(second.has_next())
+        ids = [post.id for post in first] + [post.id for post in second]
+        self.assertCountEqual(ids, Post.objects.values_list('id', flat=True))
+        content = self.client.get(
+            self.url, {'q': 'слово'}
+        ).content.decode()
+        self.assertIn('?q=%D1%81%D0%BB%D0%BE%D0%B2%D0%BE&amp;after=', content)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты по индексу."""
+        post = Post.objects.create(author=self.user, text='Привет, мир')
+        Post.objects.create(author=self.user, text='Пока')
+        queryset, _ = admin.site._registry[Post].get_search_results(
+            None, Post.objects.all(), 'мир'
+        )
+        self.assertEqual(list(queryset), [post])
+
+
+class ArchiveViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Новый пост')
+        cls.archived = ArchivedPost.objects.create(
+            id=cls.post.id + 1,
+            author=cls.user,
+            text='Архивный пост',
+            pub_date=cls.post.pub_date - datetime.timedelta(days=400),
+            updated=cls.post.pub_date,
+        )
+        # архивные посты входят в счётчик автора
+        change_counters({author_key(cls.user.id): 1})
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_post_detail_falls_through_to_archive(self):
+        """Архивный пост открывается по прежнему адресу, без формы."""
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=[self.archived.id])
+        )
+        self.assertEqual(response.context['post'], self.archived)
+        self.assertTrue(response.context['archived'])
+        self.assertNotContains(
+            response, reverse('posts:add_comment', args=[self.archived.id])
+        )
+
+    @override_settings(MAX_PAGE_AMOUNT=1)
+    def test_profile_lists_archive_after_posts(self):
+        """Профиль листается от новых постов к архивным."""
+        url = reverse('posts:profile', args=[self.user.username])
+        first = self.client.get(url).context['page_obj']
+        self.assertEqual(list(first), [self.post])
+        second = self.client.get(
+            url, {'after': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(second), [self.archived])
+        self.assertFalse(second.has_next())
+        numbered = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertEqual(list(numbered), [self.archived])
+
+    def test_chain_counts_posts_from_counter(self):
+        """С общим счётчиком обычные посты не пересчитываются COUNT(*)."""
+        chain = ArchiveChain(
+            self.user.posts.all(), self.user.archived_posts.all(), count=2
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(chain.hot_count(), 1)
+            self.assertEqual(chain.count(), 2)
+        self.assertEqual(len(queries), 1)
+        self.assertIn(ArchivedPost._meta.db_table, queries[0]['sql'])
+
+    def test_profile_export_includes_archive(self):
+        """Выгрузка профиля идёт по дате, начиная с архивного поста."""
+        response = self.authorized_client.get(
+            reverse('posts:profile_export', args=[self.user.username])
+        )
+        records = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [record['id'] for record in records],
+            [self.archived.id, self.post.id],
+        )
+
+
+class ExportViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slag',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост, "с кавычками"'
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_json_export_streams_posts_with_comments(self):
+        """Все посты автора по пачкам, комментарии внутри своих постов."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=str(i)) for i in range(4)
+        )
+        response, content = self.export(
+            reverse('posts:profile_export', args=[self.user.username])
+        )
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="auth.jsonl"',
+        )
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(records), 5)
+        first = records[0]
+        self.assertEqual(first['text'], self.post.text)
+        self.assertEqual(first['group'], self.group.slug)
+        self.assertEqual(first['comments'][0]['text'], 'Комментарий')
+
+    def test_csv_export(self):
+        _, content = self.export(
+            reverse('posts:group_export', args=[self.group.slug]),
+            data={'format': 'csv'},
+        )
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        comment = self.post.comments.get()
+        self.assertEqual(rows[0][0], 'type')
+        self.assertEqual(rows[1][-1], self.post.text)
+        self.assertEqual(
+            rows[2][:3], ['comment', str(comment.id), str(self.post.id)]
+        )
+
+    def test_export_gzipped_on_request(self):
+        response, content = self.export(
+            reverse('posts:profile_export', args=[self.user.username]),
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Комментарий', gzip.decompress(content).decode())
+
+    def test_export_requires_login(self):
+        self.client.logout()
+        url = reverse('posts:profile_export', args=[self.user.username])
+        response = self.client.get(url)
+        self.assertRedirects(
+            response, f'{reverse("users:login")}?next={url}'
+        )
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            reverse('posts:group_export', args=[self.group.slug]),
+            {'format': 'xml'},
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class AutocompleteViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url = reverse('posts:autocomplete')
+        cls.author = User.objects.create_user(username='andrey')
+        User.objects.create_user(username='anna')
+        User.objects.create_user(username='boris')
+        cls.group = Group.objects.create(
+            title='Аниме', slug='anime', description='Описание'
+        )
+        for i in range(2):
+            Post.objects.create(author=cls.author, text=str(i))
+
+    def setUp(self):
+        # индекс живёт в памяти процесса и переживает откат базы
+        cache.clear()
+        autocomplete.build()
+
+    def suggest(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        return [item['value'] for item in response.json()['results']]
+
+    def test_matches_ordered_by_posts(self):
+        """Подсказки по префиксу, сначала авторы и группы с постами."""
+        self.assertEqual(self.suggest('An'), ['andrey', 'anna', 'anime'])
+        self.assertEqual(self.suggest('ани'), ['anime'])
+        self.assertEqual(self.suggest('an', limit=1), ['andrey'])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_index_updated_on_save(self):
+        """Новые и изменённые группы и пользователи видны сразу."""
+        self.suggest('a')
+        User.objects.create_user(username='anton')
+        self.group.slug = 'cartoons'
+        self.group.save()
+        self.assertEqual(self.suggest('an'), ['andrey', 'anna', 'anton'])
+        self.assertEqual(self.suggest('car'), ['cartoons'])
+
+    def test_changes_reach_other_processes(self):
+        """Процесс с чужим индексом видит снимок и изменения после него."""
+        User.objects.create_user(username='anton')
+        # так индекс выглядит в процессе, который ещё не отвечал
+        autocomplete.index.fill({}, None)
+        self.assertEqual(
+            self.suggest('an'), ['andrey', 'anna', 'anton', 'anime']
+        )
+
+    def test_request_does_not_rebuild(self):
+        """Подсказка не обходит таблицы, даже если снимка ещё нет."""
+        cache.clear()
+        autocomplete.index.fill({}, None)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('an'), [])
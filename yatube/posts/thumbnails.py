@@ -0,0 +1,362 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, delete
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+
+from .counters import image_key, post_keys
+from .generations import bump, post_scope
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def thumbnail_options(source, options):
+    """Опции миниатюры с подстановками sorl по умолчанию.
+
+    Повторяет ThumbnailBackend.get_thumbnail, чтобы имя файла совпадало
+    с тем, что выбрал бы сам sorl.
+    """
+    backend = default.backend
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_file(source, geometry, options):
+    name = default.backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def variants(name):
+    """(формат, ширина, геометрия, опции) всех вариантов миниатюры.
+
+    Из геометрии POST_THUMBNAILS получаются варианты ширин
+    POST_THUMBNAIL_WIDTHS с той же пропорцией в каждом формате
+    POST_THUMBNAIL_FORMATS.
+    """
+    geometry, options = settings.POST_THUMBNAILS[name]
+    width, height = (int(side) for side in geometry.split('x'))
+    widths = sorted(
+        {size for size in settings.POST_THUMBNAIL_WIDTHS if size < width}
+        | {width}
+    )
+    for image_format, extra in settings.POST_THUMBNAIL_FORMATS.items():
+        for size in widths:
+            yield (
+                image_format,
+                size,
+                f'{size}x{round(height * size / width)}',
+                dict(options, format=image_format, **extra),
+            )
+
+
+def generate_thumbnails(image):
+    """Делает недостающие варианты всех миниатюр картинки.
+
+    Исходник декодируется один раз на все варианты. Файлы миниатюр,
+    которые уже лежат в хранилище (их делали для поста с той же
+    картинкой), только заново записываются в key-value store.
+    Возвращает число добавленных вариантов.
+    """
+    source = ImageFile(image)
+    missing = []
+    for name in settings.POST_THUMBNAILS:
+        for _, _, geometry, options in variants(name):
+            options = thumbnail_options(source, options)
+            thumbnail = thumbnail_file(source, geometry, options)
+            if default.kvstore.get(thumbnail) is None:
+                missing.append((geometry, options, thumbnail))
+    if not missing:
+        return 0
+    absent = [
+        (geometry, options, thumbnail)
+        for geometry, options, thumbnail in missing
+        if not thumbnail.exists()
+    ]
+    if absent:
+        source_image = default.engine.get_image(source)
+        try:
+            source.set_size(default.engine.get_image_size(source_image))
+            image_info = default.engine.get_image_info(source_image)
+            for geometry, options, thumbnail in absent:
+                options['image_info'] = image_info
+                default.backend._create_thumbnail(
+                    source_image, geometry, options, thumbnail
+                )
+        finally:
+            default.engine.cleanup(source_image)
+    default.kvstore.get_or_set(source)
+    for _, _, thumbnail in missing:
+        default.kvstore.set(thumbnail, source)
+    return len(missing)
+
+
+def thumbnails_version():
+    """Хеш настроек всех миниатюр: меняется вместе с их вариантами."""
+    config = repr([
+        (name, list(variants(name))) for name in settings.POST_THUMBNAILS
+    ])
+    return hashlib.md5(config.encode()).hexdigest()
+
+
+def sources_key(image, name):
+    # в ключе и настройки вариантов: их смена не отдаст старые URL
+    config = repr((image.name, list(variants(name))))
+    return f'thumb_urls:{name}:{hashlib.md5(config.encode()).hexdigest()}'
+
+
+def srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {size}w' for size, thumbnail in thumbnails
+    )
+
+
+def variant_files(image, name):
+    """(формат, ширина, файл) вариантов миниатюры картинки."""
+    source = ImageFile(image)
+    return [
+        (
+            image_format,
+            size,
+            thumbnail_file(
+                source, geometry, thumbnail_options(source, options)
+            ),
+        )
+        for image_format, size, geometry, options in variants(name)
+    ]
+
+
+def lookup_thumbnails(files):
+    """Готовые миниатюры из key-value store sorl по ключу файла.
+
+    Хранилище sorl держит записи в кеше, поэтому все они читаются
+    одним get_many; в kvstore.get, то есть в базу, идут только ключи,
+    которых нет в кеше.
+    """
+    kv_cache = getattr(default.kvstore, 'cache', None)
+    found = {}
+    if kv_cache is not None:
+        keys = {add_prefix(file.key): file.key for file in files}
+        for key, value in kv_cache.get_many(keys).items():
+            if value != EMPTY_VALUE:
+                found[keys[key]] = deserialize_image_file(value)
+            else:
+                found[keys[key]] = None
+    for file in files:
+        if file.key not in found:
+            found[file.key] = default.kvstore.get(file)
+    return found
+
+
+def build_sources(thumbnails):
+    """URL вариантов для <picture> или None, если готовы не все."""
+    found = {}
+    for image_format, size, thumbnail in thumbnails:
+        if thumbnail is None:
+            return None
+        found.setdefault(image_format, []).append((size, thumbnail))
+    *extra_formats, fallback_format = settings.POST_THUMBNAIL_FORMATS
+    largest = found[fallback_format][-1][1]
+    return {
+        'sources': [
+            {
+                'type': f'image/{image_format.lower()}',
+                'srcset': srcset(found[image_format]),
+            }
+            for image_format in extra_formats
+        ],
+        'srcset': srcset(found[fallback_format]),
+        'src': largest.url,
+        'width': largest.width,
+        'height': largest.height,
+    }
+
+
+def image_sources_many(images, name):
+    """Готовые варианты миниатюр картинок: {имя картинки: варианты}.
+
+    Для картинок, у которых ещё не все варианты готовы, значение None.
+    Картинки здесь никогда не обрабатываются: варианты делает фоновый
+    поток, см. schedule_thumbnails. Собранные URL кешируются и читаются
+    одним get_many на все картинки страницы.
+    """
+    keys = {sources_key(image, name): image for image in images if image}
+    found = cache.get_many(keys)
+    missing = {
+        key: variant_files(image, name)
+        for key, image in keys.items()
+        if key not in found
+    }
+    if missing:
+        thumbnails = lookup_thumbnails([
+            file for files in missing.values() for _, _, file in files
+        ])
+        collected = {
+            key: build_sources(
+                (image_format, size, thumbnails[file.key])
+                for image_format, size, file in files
+            )
+            for key, files in missing.items()
+        }
+        ready = {
+            key: sources
+            for key, sources in collected.items()
+            if sources is not None
+        }
+        cache.set_many(ready, settings.POST_CARD_TIMEOUT)
+        found.update(ready)
+    return {image.name: found.get(key) for key, image in keys.items()}
+
+
+def image_sources(image, name):
+    """Готовые варианты миниатюры одной картинки или None."""
+    if not image:
+        return None
+    return image_sources_many([image], name)[image.name]
+
+
+def attach_image_sources(posts, name):
+    """Раскладывает варианты миниатюр по постам перед рендером.
+
+    Шаблон берёт их из post.image_sources вместо поиска по одному посту.
+    """
+    posts = list(posts)
+    sources = image_sources_many([post.image for post in posts], name)
+    for post in posts:
+        if not hasattr(post, 'image_sources'):
+            post.image_sources = {}
+        post.image_sources[name] = sources.get(post.image.name)
+    return posts
+
+
+def stored_image(name):
+    """Файл картинки поста по имени, в хранилище поля Post.image.
+
+    Хранилище входит в ключи sorl: ImageFile(name) без него указывал
+    бы на default_storage, и его миниатюры не нашлись бы шаблонами.
+    """
+    from .models import Post
+
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def delete_unused_image(name):
+    """Удаляет файл картинки и его миниатюры, если постов с ним нет."""
+    from .models import PostCounter
+
+    key = image_key(name)
+    if PostCounter.objects.filter(key=key, value__gt=0).exists():
+        return
+    PostCounter.objects.filter(key=key).delete()
+    image = stored_image(name)
+    # файл, записи key-value store и файлы миниатюр
+    delete(image)
+    cache.delete_many([
+        sources_key(image, thumbnail) for thumbnail in settings.POST_THUMBNAILS
+    ])
+
+
+def release_image(name):
+    """Освобождает ссылку поста на файл картинки.
+
+    Одинаковые картинки хранятся одним файлом (ContentAddressedStorage),
+    поэтому файл удаляется только после коммита и только если счётчик
+    ссылающихся на него постов дошёл до нуля.
+    """
+    transaction.on_commit(lambda: delete_unused_image(name))
+
+
+def refresh_posts(posts):
+    """Сбрасывает закешированные карточки и страницы постов.
+
+    В них пока стоит заглушка вместо миниатюры.
+    """
+    posts = list(posts)
+    if not posts:
+        return
+    updated = timezone.now()
+    type(posts[0]).objects.filter(
+        pk__in=[post.pk for post in posts]
+    ).update(updated=updated)
+    scopes = set()
+    for post in posts:
+        post.updated = updated
+        scopes.update(post_keys(post.author_id, post.group_id))
+        scopes.add(post_scope(post.pk))
+    bump(scopes)
+
+
+def refresh_post(post):
+    refresh_posts([post])
+
+
+def process_post(post_id):
+    from .models import Post
+
+    try:
+        post = Post.objects.filter(pk=post_id).first()
+        if post is None or not post.image:
+            return
+        generate_thumbnails(post.image)
+        refresh_post(post)
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры поста %s', post_id)
+    finally:
+        if settings.THUMBNAIL_WORKERS:
+            # у потока пула своё соединение с базой
+            connection.close()
+
+
+def backfill_image(name):
+    """Делает недостающие миниатюры картинки для backfill_thumbnails.
+
+    Выполняется в процессе пула. Возвращает имя картинки, если у неё
+    появились новые варианты, иначе None.
+    """
+    try:
+        if generate_thumbnails(stored_image(name)):
+            return name
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры картинки %s', name)
+    return None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def schedule_thumbnails(post):
+    """Ставит генерацию миниатюр поста в фон после коммита."""
+    post_id = post.pk
+
+    def submit():
+        if settings.THUMBNAIL_WORKERS:
+            get_executor().submit(process_post, post_id)
+        else:
+            process_post(post_id)
+
+    transaction.on_commit(submit)
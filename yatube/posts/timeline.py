@@ -0,0 +1,197 @@
+import heapq
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.functional import cached_property
+
+from .counters import authors_with_followers_over, followers_key, get_count
+from .models import Follow, Post, TimelineEntry
+from .utils import CursorPaginator, keyset_slice
+
+# сколько записей лент создаёт один INSERT в unpull
+UNPULL_BATCH_SIZE = 10000
+
+
+def make_entry(user_id, post):
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.id,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def trim_timelines(user_ids):
+    """Оставляет в лентах пользователей по TIMELINE_LENGTH записей.
+
+    `user_ids` - список или подзапрос с id. Лишние записи всех лент
+    удаляются одним DELETE: номер записи в ленте даёт ROW_NUMBER()
+    по индексу (user, -pub_date, -post). Django 2.2 не фильтрует по
+    оконным функциям, поэтому внешний запрос написан на SQL.
+    """
+    ranked = TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('pub_date').desc(), F('post_id').desc()],
+        )
+    ).order_by().values('id', 'position')
+    sql, params = ranked.query.sql_with_params()
+    table = TimelineEntry._meta.db_table
+    using = router.db_for_write(TimelineEntry)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN '
+            f'(SELECT id FROM ({sql}) AS ranked WHERE ranked.position > %s)',
+            (*params, settings.TIMELINE_LENGTH),
+        )
+
+
+def is_pulled(author_id):
+    """Посты автора читаются при просмотре ленты, а не раскладываются."""
+    followers = get_count(followers_key(author_id))
+    return followers > settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    entries = [make_entry(user_id, post) for user_id in follower_ids]
+    if not entries:
+        return
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    trim_timelines(follower_ids)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).only('id', 'author_id', 'pub_date')[:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [make_entry(user_id, post) for post in posts],
+        ignore_conflicts=True,
+    )
+    trim_timelines([user_id])
+
+
+def unpull(author_id):
+    """Раскладывает посты автора, который перестал быть популярным.
+
+    Пока подписчиков было больше TIMELINE_FANOUT_LIMIT, посты автора
+    подмешивались при чтении и в ленты не попадали. Вызывается после
+    отписки: если подписчиков стало ровно TIMELINE_FANOUT_LIMIT, их
+    ленты получают последние посты автора. Возвращает id подписчиков,
+    чьи ленты изменились.
+    """
+    if get_count(followers_key(author_id)) != settings.TIMELINE_FANOUT_LIMIT:
+        return []
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).only('id', 'author_id', 'pub_date')[:settings.TIMELINE_LENGTH])
+    if not posts:
+        return []
+    follower_ids = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    user_ids = list(follower_ids)
+    # записи создаются пачками, а не все подписчики x посты разом
+    step = max(1, UNPULL_BATCH_SIZE // len(posts))
+    for start in range(0, len(user_ids), step):
+        TimelineEntry.objects.bulk_create(
+            [
+                make_entry(user_id, post)
+                for user_id in user_ids[start:start + step]
+                for post in posts
+            ],
+            ignore_conflicts=True,
+        )
+    trim_timelines(follower_ids)
+    return user_ids
+
+
+def rebuild(user_ids):
+    """Собирает ленты пользователей заново по их подпискам."""
+    pulled = authors_with_followers_over(settings.TIMELINE_FANOUT_LIMIT)
+    for user_id in user_ids:
+        posts = Post.objects.filter(
+            author__following__user_id=user_id
+        ).exclude(author_id__in=pulled).order_by(
+            '-pub_date', '-id'
+        ).only('id', 'author_id', 'pub_date')[:settings.TIMELINE_LENGTH]
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id=user_id).delete()
+            TimelineEntry.objects.bulk_create(
+                [make_entry(user_id, post) for post in posts]
+            )
+
+
+def drop_author(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class TimelinePaginator(CursorPaginator):
+    """Лента подписок: готовая TimelineEntry плюс посты популярных авторов.
+
+    Посты авторов, у которых больше TIMELINE_FANOUT_LIMIT подписчиков,
+    не раскладываются по лентам при публикации. При чтении страницы
+    их посты читаются одним запросом и сливаются с материализованной
+    лентой по тому же ключу (pub_date, post_id).
+    """
+
+    def __init__(self, user, per_page):
+        entries = TimelineEntry.objects.filter(
+            user=user
+        ).select_related('post__author', 'post__group')
+        super().__init__(entries, per_page)
+        self.user = user
+
+    @cached_property
+    def pulled_authors(self):
+        authors = authors_with_followers_over(settings.TIMELINE_FANOUT_LIMIT)
+        if not authors:
+            return []
+        return list(Follow.objects.filter(
+            user=self.user, author_id__in=authors
+        ).values_list('author_id', flat=True))
+
+    def fetch(self, key, forward, limit):
+        entries = keyset_slice(
+            self.object_list, key, forward, limit, id_field='post_id'
+        )
+        streams = [[entry.post for entry in entries]]
+        if self.pulled_authors:
+            # один запрос на всех популярных авторов, а не по автору
+            streams.append(keyset_slice(
+                Post.objects.filter(
+                    author_id__in=self.pulled_authors
+                ).select_related('author', 'group'),
+                key,
+                forward,
+                limit,
+            ))
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (post.pub_date, post.id),
+            reverse=forward,
+        )
+        posts = []
+        seen = set()
+        for post in merged:
+            # пост мог попасть в ленту, пока автор был непопулярным
+            if post.id in seen:
+                continue
+            seen.add(post.id)
+            posts.append(post)
+            if len(posts) == limit:
+                break
+        return posts
@@ -0,0 +1,172 @@
+import os
+from base64 import b64encode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+# сколько начала файла читать в поисках размеров картинки
+HEADER_LIMIT = 256 * 1024
+TOO_MANY_BYTES = 'Файл больше {limit} МБ.'
+TOO_MANY_PIXELS = 'Картинка больше {limit} мегапикселей.'
+# EXIF Orientation, при которых картинку надо повернуть на 90 градусов
+TRANSPOSED = {5, 6, 7, 8}
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку на диск по кускам и сразу проверяет лимиты.
+
+    Как только файл превышает POST_IMAGE_MAX_BYTES или из заголовка
+    видно, что в картинке больше POST_IMAGE_MAX_PIXELS пикселей,
+    остаток не пишется, а у файла появляется upload_error для формы.
+    Картинки больше POST_IMAGE_MAX_SIDE по длинной стороне уменьшаются
+    здесь же, один раз, и миниатюры потом делаются из уменьшенной.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.upload_error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload_error is not None:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            limit = settings.POST_IMAGE_MAX_BYTES / 1024 / 1024
+            self.upload_error = TOO_MANY_BYTES.format(limit=f'{limit:g}')
+            return None
+        if self.header is not None:
+            self.check_pixels(raw_data)
+            if self.upload_error is not None:
+                return None
+        self.file.write(raw_data)
+        return None
+
+    def check_pixels(self, raw_data):
+        self.header += raw_data
+        try:
+            # открытие читает только заголовок, пиксели не декодируются
+            width, height = Image.open(BytesIO(self.header)).size
+        except Image.DecompressionBombError:
+            width, height = Image.MAX_IMAGE_PIXELS, 2
+        except Exception:
+            if len(self.header) >= HEADER_LIMIT:
+                # не картинка: откажет валидация формы
+                self.header = None
+            return
+        self.header = None
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            limit = settings.POST_IMAGE_MAX_PIXELS / 1000 / 1000
+            self.upload_error = TOO_MANY_PIXELS.format(limit=f'{limit:g}')
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if self.upload_error is not None:
+            uploaded.upload_error = self.upload_error
+            return uploaded
+        return shrink_image(uploaded)
+
+
+def shrink_image(uploaded):
+    """Уменьшает картинку до POST_IMAGE_MAX_SIDE по длинной стороне.
+
+    JPEG декодируется сразу в уменьшенном масштабе (draft), так что
+    полноразмерная картинка в память не попадает. EXIF в уменьшенную
+    не переносится, поэтому она сразу поворачивается по Orientation.
+    Формат, который Pillow читает, но не пишет, сохраняется как PNG
+    или JPEG; если не выйдет и это, остаётся исходный файл.
+    """
+    limit = settings.POST_IMAGE_MAX_SIDE
+    try:
+        image = Image.open(uploaded)
+        image_format = image.format
+        if max(image.size) <= limit:
+            return uploaded
+        image.draft(None, (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit))
+        shrunk = save_image(image, image_format, uploaded)
+    except Exception:
+        uploaded.seek(0)
+        return uploaded
+    uploaded.close()
+    return shrunk
+
+
+def save_image(image, image_format, uploaded):
+    """Пишет картинку во временный файл загрузки того же формата."""
+    name = uploaded.name
+    content_type = uploaded.content_type
+    Image.init()
+    if image_format not in Image.SAVE:
+        if 'A' in image.getbands() or 'transparency' in image.info:
+            image_format = 'PNG'
+        else:
+            image, image_format = image.convert('RGB'), 'JPEG'
+        name = f'{os.path.splitext(name)[0]}.{image_format.lower()}'
+        content_type = Image.MIME[image_format]
+    shrunk = TemporaryUploadedFile(
+        name,
+        content_type,
+        0,
+        uploaded.charset,
+        uploaded.content_type_extra,
+    )
+    try:
+        image.save(shrunk, image_format)
+    except Exception:
+        shrunk.close()
+        raise
+    shrunk.size = shrunk.tell()
+    shrunk.seek(0)
+    return shrunk
+
+
+def image_preview(file):
+    """(ширина, высота, data URI превью) картинки.
+
+    Превью - JPEG со стороной POST_IMAGE_PREVIEW_SIDE, его страница
+    показывает сразу, без отдельного запроса. JPEG декодируется сразу
+    в уменьшенном масштабе (draft).
+    """
+    side = settings.POST_IMAGE_PREVIEW_SIDE
+    file.seek(0)
+    try:
+        image = Image.open(file)
+        width, height = image.size
+        if image.getexif().get(0x0112) in TRANSPOSED:
+            width, height = height, width
+        image.draft('RGB', (side, side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((side, side))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # прозрачность - на белом фоне, как у карточки
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image)
+            image = background
+        preview = BytesIO()
+        image.convert('RGB').save(preview, 'JPEG', quality=60)
+    finally:
+        file.seek(0)
+    encoded = b64encode(preview.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{encoded}'
+
+
+def fill_image_preview(post):
+    """Записывает в пост размеры и превью его картинки."""
+    post.image_width = post.image_height = None
+    post.image_preview = ''
+    if not post.image:
+        return
+    try:
+        width, height, preview = image_preview(post.image)
+    except Exception:
+        # не картинка или битый файл: обойдёмся заглушкой
+        return
+    post.image_width, post.image_height = width, height
+    post.image_preview = preview
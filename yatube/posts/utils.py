@@ -1,7 +1,160 @@
-from django.core.paginator import Paginator
+import datetime
 
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
 
-def paginator_function(posts, request):
-    paginator = Paginator(posts, 10)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def encode_cursor(post):
+    """Курсор поста в виде `<микросекунды pub_date>-<id>`."""
+    return f'{(post.pub_date - EPOCH) // ONE_MICROSECOND}-{post.pk}'
+
+
+def decode_cursor(value):
+    """Разбирает курсор, для битого значения возвращает None."""
+    try:
+        # до 1970 года микросекунды отрицательные: "-123-5"
+        microseconds, pk = value.rsplit('-', 1)
+        return EPOCH + int(microseconds) * ONE_MICROSECOND, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+class CursorPage(Page):
+    """Страница keyset-пагинации, совместимая с `page_obj` в шаблонах."""
+
+    cursor_mode = True
+    encode_cursor = staticmethod(encode_cursor)
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # курсоры считаем сразу: вьюха может подменить object_list
+        self.next_cursor = (
+            self.encode_cursor(object_list[-1]) if has_next else None
+        )
+        self.previous_cursor = (
+            self.encode_cursor(object_list[0])
+            if has_previous and object_list else None
+        )
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+class CountedPaginator(Paginator):
+    """Paginator, который берёт число объектов из счётчика, а не COUNT(*)."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+def keyset_slice(queryset, key, forward, limit, id_field='id'):
+    """До `limit` объектов за курсором `key` (или с начала, если None).
+
+    forward=True идёт от новых постов к старым, False - в обратную
+    сторону. `id_field` - поле, которое разбивает совпадения pub_date.
+    """
+    if forward:
+        queryset = queryset.order_by('-pub_date', f'-{id_field}')
+        lookup = 'lt'
+    else:
+        queryset = queryset.order_by('pub_date', id_field)
+        lookup = 'gt'
+    if key is not None:
+        pub_date, pk = key
+        queryset = queryset.filter(
+            Q(**{f'pub_date__{lookup}': pub_date})
+            | Q(pub_date=pub_date, **{f'{id_field}__{lookup}': pk})
+        )
+    return list(queryset[:limit])
+
+
+class CursorPaginator(CountedPaginator):
+    """Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Каждая страница - это один запрос `WHERE (pub_date, id) < курсор
+    LIMIT per_page + 1`, поэтому глубокие страницы стоят столько же,
+    сколько первая. `count` и `num_pages` по-прежнему доступны,
+    но считаются только при явном обращении.
+    """
+
+    page_class = CursorPage
+    decode_cursor = staticmethod(decode_cursor)
+
+    def fetch(self, key, forward, limit):
+        """Объекты страницы; наследники могут собирать их иначе."""
+        return keyset_slice(self.object_list, key, forward, limit)
+
+    def page_after(self, cursor=None):
+        key = self.decode_cursor(cursor)
+        objects = self.fetch(key, True, self.per_page + 1)
+        return self.page_class(
+            objects[:self.per_page],
+            self,
+            has_next=len(objects) > self.per_page,
+            has_previous=key is not None,
+        )
+
+    def page_before(self, cursor):
+        key = self.decode_cursor(cursor)
+        if key is None:
+            return self.page_after()
+        objects = self.fetch(key, False, self.per_page + 1)
+        if len(objects) <= self.per_page:
+            # Дошли до начала ленты - отдаём полноценную первую страницу.
+            return self.page_after()
+        return self.page_class(
+            objects[:self.per_page][::-1],
+            self,
+            has_next=True,
+            has_previous=True,
+        )
+
+
+def cursor_page(paginator, request):
+    """Страница keyset-пагинации по параметрам `?after=` / `?before=`."""
+    before = request.GET.get('before')
+    if before is not None:
+        return paginator.page_before(before)
+    return paginator.page_after(request.GET.get('after'))
+
+
+def paginator_function(posts, request, count=None):
+    """Нумерованные страницы для `?page=N`, иначе keyset-пагинация.
+
+    `count` - заранее известное число постов (из PostCounter).
+    """
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None:
+        paginator = CountedPaginator(
+            posts, settings.MAX_PAGE_AMOUNT, count=count
+        )
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, settings.MAX_PAGE_AMOUNT, count=count)
+    return cursor_page(paginator, request)
+
+
+def query_budget(queries):
+    """Объявляет предельное число SQL-запросов вьюхи.
+
+    Бюджет не должен зависеть от числа постов; его соблюдение проверяет
+    QueryBudgetTest для каждого адреса из posts/urls.py.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
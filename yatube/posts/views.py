@@ -1,62 +1,223 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from django.views.decorators.cache import cache_page
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import etag
+
+from core.replicas import read_from_replica
 
+from .archive import archive_page, find_post
+from .autocomplete import suggest
+from .counters import ALL_POSTS, author_key, get_count, group_key
+from .export import export_response
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User
-from .utils import paginator_function
+from .generations import (GROUPS_SCOPE, post_scope, scope_version,
+                          timeline_scope)
+from .models import ArchivedPost, Follow, Group, Post, User
+from .search import SearchPaginator
+from .timeline import TimelinePaginator
+from .utils import cursor_page, paginator_function, query_budget
+
+
+def page_etag(request, *scopes):
+    """ETag страницы по поколениям её областей ленты.
+
+    Поколения лежат в кеше и меняются при любой правке постов,
+    комментариев и групп, поэтому для 304 не нужны ни выборка постов,
+    ни рендер шаблона. В ETag входят пользователь и CSRF-cookie:
+    шапка и формы на страницах у каждого свои.
+    """
+    parts = (
+        scope_version(GROUPS_SCOPE, *scopes),
+        request.get_full_path(),
+        request.user.id,
+        request.META.get('CSRF_COOKIE'),
+    )
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def index_etag(request):
+    return page_etag(request, ALL_POSTS)
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True
+    ).first()
+    if group_id is None:
+        return None
+    return page_etag(request, group_key(group_id))
+
 
+def profile_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'id', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    # кнопка подписки зависит от ленты текущего пользователя
+    return page_etag(
+        request, author_key(author_id), timeline_scope(request.user.id)
+    )
+
+
+def post_etag(request, post_id):
+    for model in (Post, ArchivedPost):
+        author_id = model.objects.filter(id=post_id).values_list(
+            'author_id', flat=True
+        ).first()
+        if author_id is not None:
+            break
+    else:
+        return None
+    return page_etag(request, post_scope(post_id), author_key(author_id))
 
+
+@query_budget(4)
+@read_from_replica
+@etag(index_etag)
 def index(request):
     template = "posts/index.html"
-    post_list = Post.objects.all()
-    page_obj = paginator_function(post_list, request)
+    post_list = Post.objects.select_related('author', 'group')
+    page_obj = paginator_function(
+        post_list, request, count=get_count(ALL_POSTS)
+    )
     context = {
         'page_obj': page_obj,
+        'feed_version': scope_version(ALL_POSTS, GROUPS_SCOPE),
     }
     return render(request, template, context)
 
 
+@query_budget(6)
+@read_from_replica
+@etag(group_etag)
 def group_posts(request, slug):
     template = "posts/group_list.html"
     group = get_object_or_404(Group, slug=slug)
-    group_all = group.posts.all()
-    page_obj = paginator_function(group_all, request)
+    group_all = group.posts.select_related('author', 'group')
+    page_obj = paginator_function(
+        group_all, request, count=get_count(group_key(group.id))
+    )
     context = {
         "group": group,
         "page_obj": page_obj,
+        "feed_version": scope_version(group_key(group.id), GROUPS_SCOPE),
     }
     return render(request, template, context)
 
 
+@query_budget(8)
+@read_from_replica
+@etag(profile_etag)
 def profile(request, username):
     template = "posts/profile.html"
     author = get_object_or_404(User, username=username)
-    posts_all = author.posts.all()
-    page_obj = paginator_function(posts_all, request)
+    posts_all = author.posts.select_related('author', 'group')
+    archived = author.archived_posts.select_related('author', 'group')
+    # счётчик автора учитывает и архивные посты
+    posts_count = get_count(author_key(author.id))
+    page_obj = archive_page(posts_all, archived, request, count=posts_count)
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author=author
+    ).exists()
     context = {
         'page_obj': page_obj,
         'author': author,
+        'posts_count': posts_count,
+        'following': following,
+        'feed_version': scope_version(author_key(author.id), GROUPS_SCOPE),
+    }
+    return render(request, template, context)
+
+
+# выгрузка читается из базы уже после выхода из вьюхи, по мере отдачи
+# ответа, вместе с архивными постами; gzip_page сжимает его на лету,
+# если клиент принимает gzip. Полная история - только для вошедших
+@query_budget(5)
+@login_required
+@gzip_page
+def group_export(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return export_response(
+        request, group.posts.all(), group.slug,
+        archived=group.archived_posts.all(),
+    )
+
+
+@query_budget(5)
+@login_required
+@gzip_page
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    return export_response(
+        request, author.posts.all(), author.username,
+        archived=author.archived_posts.all(),
+    )
+
+
+@query_budget(4)
+def search(request):
+    template = "posts/search.html"
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = SearchPaginator(
+            query,
+            Post.objects.select_related('author', 'group'),
+            settings.MAX_PAGE_AMOUNT,
+        )
+        page_obj = cursor_page(paginator, request)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        # ссылки пагинатора сохраняют запрос
+        'page_query': urlencode({'q': query}) + '&',
     }
     return render(request, template, context)
 
 
+@query_budget(2)
+def autocomplete(request):
+    # индекс собирает build_autocomplete, ответ обходится без базы
+    try:
+        limit = int(request.GET.get('limit', settings.AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = settings.AUTOCOMPLETE_LIMIT
+    limit = min(max(limit, 1), settings.AUTOCOMPLETE_LIMIT)
+    return JsonResponse(
+        {'results': suggest(request.GET.get('q', ''), limit)}
+    )
+
+
+# архивный пост ищется после обычного: на запрос больше в ETag и здесь
+@query_budget(8)
+@read_from_replica
+@etag(post_etag)
 def post_detail(request, post_id):
     template = "posts/post_detail.html"
-    post = get_object_or_404(Post, id=post_id)
+    post = find_post(post_id)
+    if post is None:
+        raise Http404('Нет такого поста')
     form = CommentForm(request.POST or None, files=request.FILES or None,)
-    comments = post.comments.all()
-    # author = get_object_or_404(User)
-    post = get_object_or_404(Post, id=post_id)
+    comments = post.comments.select_related('author')
     context = {
-        # 'author': author,
         'post': post,
+        'archived': isinstance(post, ArchivedPost),
         'comments': comments,
         'form': form,
+        'author_posts_count': get_count(author_key(post.author_id)),
+        'comments_version': scope_version(post_scope(post.id)),
     }
 
     return render(request, template, context)
 
+
+@query_budget(4)
 @login_required
 def add_comment(request, post_id):
     # Получите пост
@@ -70,10 +231,11 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(9)
 @login_required
 def post_create(request):
     template = "posts/create_post.html"
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     context = {
         'form': form
     }
@@ -85,13 +247,14 @@ def post_create(request):
     return redirect('posts:profile', username=request.user.username)
 
 
+@query_budget(10)
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(
         Post,
         id=post_id
     )
-    if request.user != post.author:
+    if request.user.id != post.author_id:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
                     request.POST,
@@ -108,22 +271,34 @@ def post_edit(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(6)
+@read_from_replica
 @login_required
 def follow_index(request):
-    # информация о текущем пользователе доступна в переменной request.user
-    # ...
-    context = {}
+    # материализованная лента плюс посты популярных авторов
+    paginator = TimelinePaginator(request.user, settings.MAX_PAGE_AMOUNT)
+    context = {
+        'page_obj': cursor_page(paginator, request),
+        'follow': True,
+        'feed_version': scope_version(
+            ALL_POSTS, timeline_scope(request.user.id), GROUPS_SCOPE
+        ),
+    }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(16)
 @login_required
 def profile_follow(request, username):
-    # Подписаться на автора
-    ...
+    author = get_object_or_404(User, username=username)
+    if author != request.user:
+        Follow.objects.get_or_create(user=request.user, author=author)
+    return redirect('posts:profile', username=username)
 
 
+@query_budget(8)
 @login_required
 def profile_unfollow(request, username):
-    # Дизлайк, отписка
-    ...
-
+    author = get_object_or_404(User, username=username)
+    Follow.objects.filter(user=request.user, author=author).delete()
+    return redirect('posts:profile', username=username)
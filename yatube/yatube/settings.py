@@ -13,6 +13,39 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 import os
 
 MAX_PAGE_AMOUNT = 10
+# сколько последних постов хранится в ленте подписок пользователя
+TIMELINE_LENGTH = 1000
+# посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подмешиваются в ленту при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# автодополнение групп и авторов: сколько подсказок отдавать и раз
+# в сколько секунд build_autocomplete пересобирает индекс ради свежего
+# числа постов
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_REFRESH = 5 * 60
+# постов в пачке выгрузки: столько держится в памяти, и на пачку один
+# запрос комментариев (id пачки - параметры IN, в старых SQLite до 999)
+EXPORT_CHUNK_SIZE = 500
+# посты старше стольких дней команда archive_posts переносит в архив:
+# ленты их больше не показывают, профиль и страница поста - да
+POST_ARCHIVE_DAYS = 365
+# сколько хранится отрендеренная карточка поста, сек
+POST_CARD_TIMEOUT = 60 * 60 * 24 * 7
+# миниатюры картинок постов: имя -> (геометрия sorl, опции)
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# ширины вариантов миниатюр для srcset; форматы с их опциями в порядке
+# выбора браузером, последний - для <img> без <picture>
+POST_THUMBNAIL_WIDTHS = (320, 640, 960)
+POST_THUMBNAIL_FORMATS = {
+    # WebP с качеством 80 выглядит как JPEG с 95 по умолчанию sorl
+    'WEBP': {'quality': 80},
+    'JPEG': {},
+}
+# потоки фоновой генерации миниатюр, 0 - генерировать после коммита
+# в том же потоке
+THUMBNAIL_WORKERS = 2
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -34,10 +67,34 @@ ALLOWED_HOSTS = [
 ]
 
 CACHES = {
+    # LRU в памяти процесса перед общим кешем, см. core.cache.TwoTierCache
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 30,
+            'LOCAL_PREFIXES': {
+                'post_card:': 'immutable',
+                'thumb_urls:': 'immutable',
+                'template.cache.': 'immutable',
+                # поколения фрагментов лент - из памяти процесса, но со
+                # свежим штампом: после записи ни один процесс не отдаст
+                # старый фрагмент
+                'generation:': 'checked',
+            },
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
 }
+# тесты не пишут в общий кеш разработчика, см. core.test_runner
+TEST_RUNNER = 'core.test_runner.TestRunner'
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # Application definition
@@ -57,6 +114,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.replicas.ReplicaPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -92,11 +150,43 @@ WSGI_APPLICATION = "yatube.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        # SQLite под одновременные чтение и запись, см. core.sqlite
+        "ENGINE": "core.sqlite",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        # соединение живёт между запросами, после ошибки в базе
+        # проверяется перед следующим запросом
+        "CONN_MAX_AGE": 60,
+        "OPTIONS": {
+            "PRAGMAS": {
+                # читатели не блокируют писателя и наоборот
+                "journal_mode": "WAL",
+                # в WAL fsync только на checkpoint: база не портится,
+                # при отключении питания теряются последние коммиты
+                "synchronous": "NORMAL",
+                "mmap_size": 256 * 1024 * 1024,
+                # отрицательное значение - в КиБ на соединение
+                "cache_size": -32 * 1024,
+                # сколько ждать блокировку записи, мс
+                "busy_timeout": 5000,
+            },
+        },
     }
 }
 
+# реплика для чтения лент и постов, см. core.replicas. Локально это
+# второй файл SQLite, который копирует из основной базы команда
+# sync_replicas; включается переменной окружения YATUBE_REPLICA
+if os.environ.get("YATUBE_REPLICA"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.path.join(BASE_DIR, "db-replica.sqlite3"),
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+# сколько секунд после записи клиент читает из основной базы; должно
+# быть больше отставания реплики
+REPLICA_PIN_SECONDS = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -137,6 +227,16 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"),)
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# загрузки пишутся на диск по кускам с проверкой лимитов картинок постов
+FILE_UPLOAD_HANDLERS = ['posts.uploads.ImageUploadHandler']
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+# картинки больше по длинной стороне уменьшаются при загрузке
+POST_IMAGE_MAX_SIDE = 2048
+# длинная сторона превью, которое встраивается в страницу до загрузки
+# миниатюры
+POST_IMAGE_PREVIEW_SIDE = 20
+
 # yatube/settings.py
 
 LOGIN_URL = 'users:login'